@@ -0,0 +1,236 @@
+"""
+Runs emulators inside an asyncio event loop so a single process can host many of them, one
+task per emulator instead of one thread:
+
+    emulator = AsyncEmulator(cpu)
+    asyncio.ensure_future(emulator.feed_keys(key_source))
+    async for frame, rows in emulator.frames():
+        ...
+    await emulator.run(frames=600)
+
+A small TCP server is included as a stand-in for a websocket front end. Every connection gets
+its own emulator running the rom, screen changes are streamed to the client in the movie
+format of delta.py and key changes sent by the client are fed to the emulator:
+
+    python aio.py ROM --port 8064
+"""
+import asyncio
+import logging
+import argparse
+from engines import ENGINES
+from headless import HeadlessDisplay
+from scheduler import Scheduler
+from delta import FrameEncoder, stream_header, write_varint
+
+logger = logging.getLogger('chippy.aio')
+
+class AsyncEmulator(object):
+    """
+    Drives a CPU from an asyncio task. Every 60 Hz frame the CPU performs its instructions and
+    the task yields to the event loop until the next frame is due. While the CPU is parked
+    waiting for a key the task sleeps until press is called.
+    """
+    def __init__(self, cpu, clock_speed = 600, realtime = True):
+        self.cpu = cpu
+        self.scheduler = Scheduler(cpu, clock_speed=clock_speed, realtime=False)
+        self.realtime = realtime
+        self.running = False
+        self.finished = False
+        self.key_pressed = None
+        self.frame_ready = None
+
+    def events(self):
+        # Created on first use so they belong to the running event loop
+        if self.frame_ready is None:
+            self.key_pressed = asyncio.Event()
+            self.frame_ready = asyncio.Condition()
+        return self.key_pressed, self.frame_ready
+
+    def press(self, key):
+        self.cpu.press_key(key)
+        self.events()[0].set()
+
+    def release(self, key):
+        self.cpu.release_key(key)
+
+    async def feed_keys(self, source):
+        """
+        Applies (key, pressed) pairs from an async iterable until it is exhausted.
+        """
+        async for key, pressed in source:
+            if pressed:
+                self.press(key)
+            else:
+                self.release(key)
+
+    async def run(self, frames = None):
+        """
+        Runs the given number of frames, or until stop is called.
+        """
+        key_pressed, frame_ready = self.events()
+        loop = asyncio.get_running_loop()
+        scheduler = self.scheduler
+        frame_time = scheduler.frame_time
+        stop_frame = None if frames is None else scheduler.frames + frames
+        self.running = True
+        next_frame = loop.time()
+        try:
+            while self.running and (stop_frame is None or scheduler.frames < stop_frame):
+                scheduler.run_frame()
+                async with frame_ready:
+                    frame_ready.notify_all()
+                if scheduler.is_parked():
+                    key_pressed.clear()
+                    while self.running and scheduler.is_parked():
+                        await key_pressed.wait()
+                        key_pressed.clear()
+                    next_frame = loop.time()
+                elif self.realtime:
+                    next_frame += frame_time
+                    delay = next_frame - loop.time()
+                    if delay < -frame_time:
+                        next_frame = loop.time()
+                    await asyncio.sleep(max(0, delay))
+                else:
+                    await asyncio.sleep(0)
+        finally:
+            self.running = False
+            self.finished = True
+            async with frame_ready:
+                frame_ready.notify_all()
+
+    def stop(self):
+        self.running = False
+        if self.key_pressed is not None:
+            self.key_pressed.set()
+
+    async def frames(self):
+        """
+        Yields (frame number, changed rows) each time the screen changes, where changed rows
+        is a list of (y, row) pairs holding the new value of every row that differs from the
+        last screen this subscriber saw. The first screen is sent whole. A subscriber that
+        falls behind skips frames but never misses a change.
+        """
+        frame_ready = self.events()[1]
+        framebuffer = self.cpu.display.framebuffer
+        seen = None
+        while True:
+            async with frame_ready:
+                if self.finished:
+                    return
+                await frame_ready.wait()
+            rows = framebuffer.rows
+            if seen is None or len(seen) != len(rows):
+                changed = list(enumerate(rows))
+            else:
+                changed = [(y, rows[y]) for y in range(0, len(rows)) if rows[y] != seen[y]]
+            if changed:
+                seen = list(rows)
+                yield self.scheduler.frames, changed
+
+async def run(cpu, frames = None, clock_speed = 600):
+    """
+    Runs a CPU for the given number of frames inside the running event loop.
+    """
+    emulator = AsyncEmulator(cpu, clock_speed)
+    await emulator.run(frames)
+    return emulator
+
+async def read_keys(reader):
+    """
+    Reads key changes sent by a client as lines of 'key state', for example '5 1'.
+    """
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        try:
+            key, pressed = line.split()
+            key = int(key, 16)
+            pressed = int(pressed)
+        except ValueError:
+            continue
+        if 0 <= key <= 0xF:
+            yield key, pressed
+
+async def stream_frames(emulator, writer):
+    """
+    Sends every screen change to a client as a packet of a movie stream, so a client can save
+    what it receives as a movie file or decode it with FrameDecoder.
+    """
+    framebuffer = emulator.cpu.display.framebuffer
+    encoder = FrameEncoder()
+    writer.write(stream_header(emulator.scheduler.frame_rate))
+    async for frame, changed in emulator.frames():
+        packet = encoder.encode(framebuffer, frame)
+        if packet is None:
+            continue
+        length = bytearray()
+        write_varint(length, len(packet))
+        writer.write(bytes(length) + packet)
+        await writer.drain()
+
+async def run_session(emulator):
+    """
+    Runs the emulator of a session until it is stopped. A SystemExit raised by the rom is
+    turned into a RuntimeError, raised inside a task it would stop the event loop and with it
+    every other session.
+    """
+    try:
+        await emulator.run()
+    except SystemExit as error:
+        raise RuntimeError("Emulator exited with code %r" % (error.code,))
+
+def make_session(rom, engine, clock_speed):
+    async def session(reader, writer):
+        peer = writer.get_extra_info('peername')
+        try:
+            cpu = ENGINES[engine](HeadlessDisplay())
+            cpu.load_rom_bytes(rom)
+        except Exception:
+            logger.exception("Session for %s could not load the rom", peer)
+            writer.close()
+            return
+        emulator = AsyncEmulator(cpu, clock_speed)
+        tasks = [asyncio.ensure_future(run_session(emulator)),
+                 asyncio.ensure_future(stream_frames(emulator, writer)),
+                 asyncio.ensure_future(emulator.feed_keys(read_keys(reader)))]
+        try:
+            # The session ends when the emulator fails, the client disconnects or it stops
+            # reading
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            emulator.stop()
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is not None:
+                    error = task.exception()
+                    if not isinstance(error, ConnectionError):
+                        logger.error("Session for %s failed", peer,
+                                     exc_info=(type(error), error, error.__traceback__))
+            # Only the connection of this session is closed, the server keeps running
+            writer.close()
+    return session
+
+async def serve(rom_path, host = '127.0.0.1', port = 8064, engine = 'block', clock_speed = 600):
+    with open(rom_path, 'rb') as rom_file:
+        rom = rom_file.read()
+    server = await asyncio.start_server(make_session(rom, engine, clock_speed), host, port)
+    async with server:
+        await server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a Chip-8 rom to many clients over TCP")
+    parser.add_argument('rom', help="path of the rom to run")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--port', type=int, default=8064, help="port to listen on")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='block',
+                        help="how opcodes are performed (default: block)")
+    parser.add_argument('--clock', type=int, default=600,
+                        help="instructions performed per second (default: 600)")
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s %(name)s: %(message)s")
+    asyncio.run(serve(args.rom, args.host, args.port, args.engine, args.clock))
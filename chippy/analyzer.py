@@ -0,0 +1,302 @@
+"""
+Static analysis of Chip-8 roms. Starting from 0x200 every instruction that can be reached is
+followed through jumps, calls, returns and skips to build the control flow graph of the rom.
+Along the way the value of register I is tracked where it is known, which finds the sprites
+and other data the rom reads and the places FX33 and FX55 write to, so writes into the rom's
+own code can be flagged.
+
+    analysis = analyze(cpu.memory)
+    print(listing(analysis, cpu.memory))
+
+A rom is only known to leave its code alone if it has no BNNN jumps, whose targets depend on
+V0, and every write goes to a known address outside the code. Engines use that to decide
+whether translated code has to be checked against writes to memory.
+
+    python analyzer.py ROM
+"""
+import argparse
+
+ROM_START = 0x200
+
+# What the bytes of memory are used for
+UNKNOWN = 0
+CODE = 1
+DATA = 2
+
+class Analysis(object):
+    """
+    The results of analyzing a rom.
+
+    instructions   - the opcode at the address of every reachable instruction
+    successors     - the addresses every instruction can continue at
+    jump_targets   - addresses reached by 1NNN jumps
+    subroutines    - addresses reached by 2NNN calls
+    kinds          - for every byte of memory whether it is CODE, DATA or UNKNOWN
+    writes         - (address of the instruction, first byte written or None if unknown,
+                     number of bytes) for every FX33 and FX55
+    indirect_jumps - addresses of the BNNN jumps, whose targets are not known
+    invalid        - addresses of reachable opcodes that are not Chip-8 instructions
+    """
+    def __init__(self, start, end, memory_size):
+        self.start = start
+        self.end = end
+        self.instructions = {}
+        self.successors = {}
+        self.jump_targets = set()
+        self.subroutines = set()
+        self.kinds = bytearray(memory_size)
+        self.writes = []
+        self.indirect_jumps = []
+        self.invalid = []
+
+    def self_modifying_writes(self):
+        """
+        Returns the addresses of the writes that may change code: those to an unknown
+        address and those overlapping an instruction.
+        """
+        addresses = []
+        for address, target, length in self.writes:
+            if target is None or CODE in self.kinds[target:target + length]:
+                addresses.append(address)
+        return addresses
+
+    def code_is_static(self):
+        """
+        Returns True if the rom is known never to change its own code while running.
+        """
+        return not self.indirect_jumps and not self.self_modifying_writes()
+
+def is_valid(opcode):
+    first_hex = opcode >> 12
+    if first_hex == 0x5 or first_hex == 0x9:
+        return opcode & 0xF == 0
+    if first_hex == 0x8:
+        return opcode & 0xF in (0x0, 0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x7, 0xE)
+    if first_hex == 0xE:
+        return opcode & 0xFF in (0x9E, 0xA1)
+    if first_hex == 0xF:
+        return opcode & 0xFF in (0x07, 0x0A, 0x15, 0x18, 0x1E, 0x29, 0x33, 0x55, 0x65)
+    return True
+
+def successors(address, opcode):
+    """
+    Returns the addresses the instruction at address can continue at.
+    """
+    first_hex = opcode >> 12
+    nnn = opcode & 0x0FFF
+    if opcode in (0x00EE, 0x00FD) or first_hex == 0xB or not is_valid(opcode):
+        return ()
+    if first_hex == 0x1:
+        return (nnn,)
+    if first_hex == 0x2:
+        # Subroutines are assumed to return to the instruction after the call
+        return (nnn, address + 2)
+    if first_hex in (0x3, 0x4, 0x5, 0x9, 0xE):
+        return (address + 2, address + 4)
+    return (address + 2,)
+
+def analyze(memory, start = ROM_START, end = None):
+    """
+    Analyzes the rom loaded into memory, starting at the given address. end is the address
+    just past the rom and only affects how the results are listed.
+    """
+    if end is None:
+        end = len(memory)
+        while end > start and memory[end - 1] == 0:
+            end -= 1
+    analysis = Analysis(start, end, len(memory))
+    kinds = analysis.kinds
+    # The value of register I on entry to every instruction, None where it is not known
+    register_I = {start: 0}
+    pending = [start]
+    while pending:
+        address = pending.pop()
+        if address + 1 >= len(memory):
+            continue
+        opcode = memory[address] << 8 | memory[address + 1]
+        first_hex = opcode >> 12
+        x = (opcode & 0x0F00) >> 8
+        nnn = opcode & 0x0FFF
+        index = register_I[address]
+        new_index = index
+        first_visit = address not in analysis.instructions
+        if first_visit:
+            analysis.instructions[address] = opcode
+            analysis.successors[address] = successors(address, opcode)
+            kinds[address] = kinds[address + 1] = CODE
+            if not is_valid(opcode):
+                analysis.invalid.append(address)
+            elif first_hex == 0x1:
+                analysis.jump_targets.add(nnn)
+            elif first_hex == 0x2:
+                analysis.subroutines.add(nnn)
+            elif first_hex == 0xB:
+                analysis.indirect_jumps.append(address)
+        if first_hex == 0xA:
+            new_index = nnn
+        elif first_hex == 0xF and opcode & 0xFF in (0x1E, 0x29):
+            new_index = None
+        elif first_hex == 0xD and index is not None:
+            mark_data(kinds, index, opcode & 0xF or 32)
+        elif first_hex == 0xF and opcode & 0xFF == 0x65 and index is not None:
+            mark_data(kinds, index, x + 1)
+        elif first_hex == 0xF and opcode & 0xFF in (0x33, 0x55):
+            length = 3 if opcode & 0xFF == 0x33 else x + 1
+            if first_visit:
+                analysis.writes.append((address, index, length))
+            elif index is None:
+                # Reached again with I no longer known, so the target is not known either
+                analysis.writes = [(address, None, length) if write[0] == address else write
+                                   for write in analysis.writes]
+            if index is not None:
+                mark_data(kinds, index, length)
+        for successor in analysis.successors[address]:
+            # A subroutine may change I before it returns
+            successor_index = None if first_hex == 0x2 and successor == address + 2 else new_index
+            if successor not in register_I:
+                register_I[successor] = successor_index
+                pending.append(successor)
+            elif register_I[successor] is not None and register_I[successor] != successor_index:
+                # Reached with two different values of I, so it is not known there
+                register_I[successor] = None
+                pending.append(successor)
+    return analysis
+
+def mark_data(kinds, address, length):
+    for offset in range(address, min(address + length, len(kinds))):
+        if kinds[offset] == UNKNOWN:
+            kinds[offset] = DATA
+
+# Names of the Super-CHIP opcodes of the form 00KK
+SYSTEM_NAMES = {0x00FB: "SCR", 0x00FC: "SCL", 0x00FD: "EXIT", 0x00FE: "LOW", 0x00FF: "HIGH"}
+
+def disassemble(opcode):
+    """
+    Returns the instruction as assembly text, or None if it is not a Chip-8 instruction.
+    """
+    if not is_valid(opcode):
+        return None
+    first_hex = opcode >> 12
+    x = (opcode & 0x0F00) >> 8
+    y = (opcode & 0x00F0) >> 4
+    n = opcode & 0x000F
+    kk = opcode & 0x00FF
+    nnn = opcode & 0x0FFF
+    if opcode == 0x00E0:
+        return "CLS"
+    if opcode == 0x00EE:
+        return "RET"
+    if opcode & 0xFFF0 == 0x00C0:
+        return "SCD %d" % n
+    if opcode & 0xFFF0 == 0x00D0:
+        return "SCU %d" % n
+    if opcode in SYSTEM_NAMES:
+        return SYSTEM_NAMES[opcode]
+    if first_hex == 0x0:
+        return "SYS 0x%03X" % nnn
+    if first_hex == 0x1:
+        return "JP 0x%03X" % nnn
+    if first_hex == 0x2:
+        return "CALL 0x%03X" % nnn
+    if first_hex == 0x3:
+        return "SE V%X, 0x%02X" % (x, kk)
+    if first_hex == 0x4:
+        return "SNE V%X, 0x%02X" % (x, kk)
+    if first_hex == 0x5:
+        return "SE V%X, V%X" % (x, y)
+    if first_hex == 0x6:
+        return "LD V%X, 0x%02X" % (x, kk)
+    if first_hex == 0x7:
+        return "ADD V%X, 0x%02X" % (x, kk)
+    if first_hex == 0x8:
+        names = {0x0: "LD", 0x1: "OR", 0x2: "AND", 0x3: "XOR", 0x4: "ADD", 0x5: "SUB",
+                 0x6: "SHR", 0x7: "SUBN", 0xE: "SHL"}
+        return "%s V%X, V%X" % (names[n], x, y)
+    if first_hex == 0x9:
+        return "SNE V%X, V%X" % (x, y)
+    if first_hex == 0xA:
+        return "LD I, 0x%03X" % nnn
+    if first_hex == 0xB:
+        return "JP V0, 0x%03X" % nnn
+    if first_hex == 0xC:
+        return "RND V%X, 0x%02X" % (x, kk)
+    if first_hex == 0xD:
+        return "DRW V%X, V%X, %d" % (x, y, n)
+    if first_hex == 0xE:
+        return ("SKP V%X" if kk == 0x9E else "SKNP V%X") % x
+    formats = {0x07: "LD V%X, DT", 0x0A: "LD V%X, K", 0x15: "LD DT, V%X", 0x18: "LD ST, V%X",
+               0x1E: "ADD I, V%X", 0x29: "LD F, V%X", 0x33: "LD B, V%X", 0x55: "LD [I], V%X",
+               0x65: "LD V%X, [I]"}
+    return formats[kk] % x
+
+def listing(analysis, memory):
+    """
+    Returns the rom as assembly text. Reachable instructions are disassembled and every other
+    byte is listed as data, with labels at the targets of jumps and calls.
+    """
+    lines = []
+    self_modifying = set(analysis.self_modifying_writes())
+    address = analysis.start
+    end = max([analysis.end] + [instruction + 2 for instruction in analysis.instructions])
+    while address < end:
+        if address in analysis.subroutines:
+            lines.append("sub_%03X:" % address)
+        elif address in analysis.jump_targets:
+            lines.append("label_%03X:" % address)
+        if address in analysis.instructions:
+            opcode = analysis.instructions[address]
+            text = disassemble(opcode) or "invalid"
+            if address in self_modifying:
+                text += "    ; may write to code"
+            elif address in analysis.indirect_jumps:
+                text += "    ; target not known"
+            lines.append("    %03X  %04X  %s" % (address, opcode, text))
+            address += 2
+            continue
+        # A run of up to 8 bytes of the same kind, ending at the next instruction or label
+        kind = analysis.kinds[address]
+        run = [memory[address]]
+        address += 1
+        while (address < end and len(run) < 8 and analysis.kinds[address] == kind
+               and address not in analysis.instructions and address not in analysis.subroutines
+               and address not in analysis.jump_targets):
+            run.append(memory[address])
+            address += 1
+        lines.append("    %03X  %-4s  db %s" % (address - len(run), "data" if kind == DATA else "",
+                                               ", ".join("0x%02X" % byte for byte in run)))
+    return "\n".join(lines)
+
+def summary(analysis):
+    code = analysis.kinds[analysis.start:analysis.end].count(CODE)
+    data = analysis.kinds[analysis.start:analysis.end].count(DATA)
+    lines = [
+        "Rom: 0x%03X-0x%03X (%d bytes)" % (analysis.start, analysis.end,
+                                            analysis.end - analysis.start),
+        "Instructions: %d reachable, %d subroutines, %d jump targets"
+        % (len(analysis.instructions), len(analysis.subroutines), len(analysis.jump_targets)),
+        "Bytes: %d code, %d data, %d unknown"
+        % (code, data, analysis.end - analysis.start - code - data),
+        "Indirect jumps: %s" % (", ".join("0x%03X" % address
+                                          for address in analysis.indirect_jumps) or "none"),
+        "Writes that may change code: %s"
+        % (", ".join("0x%03X" % address
+                     for address in analysis.self_modifying_writes()) or "none"),
+        "Code is static: %s" % ("yes" if analysis.code_is_static() else "no"),
+    ]
+    return "\n".join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Disassemble a Chip-8 rom")
+    parser.add_argument('rom', help="path of the rom to disassemble")
+    parser.add_argument('--summary', action='store_true',
+                        help="only print what the analysis found")
+    args = parser.parse_args()
+    memory = bytearray(4096)
+    with open(args.rom, 'rb') as rom:
+        rom_bytes = rom.read()
+    memory[ROM_START:ROM_START + len(rom_bytes)] = rom_bytes
+    analysis = analyze(memory, ROM_START, ROM_START + len(rom_bytes))
+    if not args.summary:
+        print(listing(analysis, memory))
+        print("")
+    print(summary(analysis))
@@ -0,0 +1,128 @@
+"""
+Runs every rom in a directory headless across a pool of processes and writes one JSON line
+per rom with the final state of the emulator:
+
+    python batch.py ROM_DIRECTORY --cycles 100000 --engine block --output results.jsonl
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import concurrent.futures
+from engines import ENGINES
+from dispatch import get_opcode_table
+from headless import HeadlessDisplay
+from scheduler import Scheduler
+
+def is_halted(cpu):
+    """
+    Returns True if the CPU is stuck on a jump to itself, the usual way a rom ends, or on the
+    Super-CHIP exit opcode 00FD.
+    """
+    opcode = cpu.get_opcode()
+    return opcode == (0x1000 | cpu.pc) or opcode == 0x00FD
+
+def run_rom(path, engine = 'block', cycles = 100000, clock_speed = 600, stop_on_halt = True,
+            seed = 0):
+    """
+    Runs the rom at path on a headless CPU for the given number of instructions, rounded up to
+    whole frames, until it halts or until it waits for a key in FX0A. Nothing presses keys in a
+    batch, so a waiting rom would otherwise never finish. Returns a dictionary describing the
+    final state.
+    """
+    display = HeadlessDisplay()
+    cpu = ENGINES[engine](display, seed)
+    cpu.load_rom_file(path)
+    scheduler = Scheduler(cpu, clock_speed=clock_speed, realtime=False)
+    halted = False
+    start = time.perf_counter()
+    while scheduler.cycles < cycles:
+        scheduler.run_frame()
+        if stop_on_halt and is_halted(cpu):
+            halted = True
+            break
+        if cpu.waiting_key is not None:
+            break
+    elapsed = time.perf_counter() - start
+    return {
+        'rom': os.path.basename(path),
+        'engine': engine,
+        'seed': seed,
+        'cycles': scheduler.cycles,
+        'frames': scheduler.frames,
+        'halted': halted,
+        'waiting_key': cpu.waiting_key,
+        'seconds': round(elapsed, 6),
+        'framebuffer': display.framebuffer.digest(),
+        'registers': [int(value) for value in cpu.registers],
+        'I': cpu.register_I,
+        'pc': cpu.pc,
+        'sp': cpu.sp,
+        'delay_timer': cpu.delay_timer,
+        'sound_timer': cpu.sound_timer,
+    }
+
+def safe_run_rom(path, *args):
+    """
+    Runs a rom in a worker process, turning any error into a result so one bad rom does not
+    stop the whole batch.
+    """
+    try:
+        return run_rom(path, *args)
+    except (Exception, SystemExit) as error:
+        # SystemExit too, it would otherwise be raised again by the pool and end the batch
+        return {'rom': os.path.basename(path), 'error': '%s: %s' % (type(error).__name__, error)}
+
+def find_roms(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if os.path.isfile(os.path.join(directory, name)))
+
+def run_batch(paths, output, engine = 'block', cycles = 100000, clock_speed = 600,
+              stop_on_halt = True, seed = 0, workers = None):
+    """
+    Runs every rom in paths across a process pool and writes a JSON line to output for each
+    one as it finishes. Returns the number of roms that failed.
+    """
+    failures = 0
+    # Built once here so workers forked from this process start with the table already built
+    get_opcode_table()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(safe_run_rom, path, engine, cycles, clock_speed, stop_on_halt,
+                                   seed)
+                   for path in paths]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            if 'error' in result:
+                failures += 1
+            output.write(json.dumps(result, sort_keys=True) + "\n")
+            output.flush()
+    return failures
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a directory of Chip-8 roms headless")
+    parser.add_argument('directory', help="directory containing the roms to run")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='block',
+                        help="how opcodes are performed (default: block)")
+    parser.add_argument('--cycles', type=int, default=100000,
+                        help="instructions to run each rom for (default: 100000)")
+    parser.add_argument('--clock', type=int, default=600,
+                        help="instructions per second of emulated time (default: 600)")
+    parser.add_argument('--no-stop-on-halt', dest='stop_on_halt', action='store_false',
+                        help="keep running roms that jump to themselves")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="seed of the random number generator of every rom (default: 0)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="number of processes (default: one per CPU)")
+    parser.add_argument('--output', default=None,
+                        help="file to write the JSON lines to (default: standard output)")
+    args = parser.parse_args()
+
+    output = sys.stdout if args.output is None else open(args.output, 'w')
+    try:
+        failures = run_batch(find_roms(args.directory), output, args.engine, args.cycles,
+                             args.clock, args.stop_on_halt, args.seed, args.workers)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,282 @@
+"""
+Throughput benchmarks for the execution engines and display backends. Every engine is run on
+a set of small synthetic roms that each stress one part of the emulator, and optionally on a
+directory of real roms, with frames run back to back as fast as the host allows:
+
+    alu     - register arithmetic and shifts in a tight loop
+    sprite  - font digits drawn across the whole screen
+    call    - nested subroutine calls and returns
+    memory  - BCD conversion and register stores and loads through I
+
+For every run the instructions per second, frames per second and the average cost of drawing
+a sprite and of presenting the screen are reported. Results are written as JSON so runs from
+different versions can be compared:
+
+    python benchmark.py --output before.json
+    python benchmark.py --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+from engines import ENGINES
+from headless import HeadlessDisplay
+from scheduler import Scheduler
+from batch import find_roms
+
+# The synthetic roms, each an endless loop
+SYNTHETIC_ROMS = {
+    'alu': bytes([
+        0x60, 0x01,  # 200: LD V0, 0x01
+        0x61, 0x03,  # 202: LD V1, 0x03
+        0x80, 0x14,  # 204: ADD V0, V1
+        0x81, 0x05,  # 206: SUB V1, V0
+        0x82, 0x06,  # 208: SHR V2
+        0x83, 0x0E,  # 20A: SHL V3
+        0x84, 0x17,  # 20C: SUBN V4, V1
+        0x80, 0x13,  # 20E: XOR V0, V1
+        0x75, 0x01,  # 210: ADD V5, 0x01
+        0x35, 0x00,  # 212: SE V5, 0x00
+        0x12, 0x04,  # 214: JP 0x204
+        0x12, 0x04,  # 216: JP 0x204
+    ]),
+    'sprite': bytes([
+        0x60, 0x00,  # 200: LD V0, 0x00
+        0x61, 0x00,  # 202: LD V1, 0x00
+        0x62, 0x00,  # 204: LD V2, 0x00
+        0xF2, 0x29,  # 206: LD F, V2
+        0xD0, 0x15,  # 208: DRW V0, V1, 5
+        0x70, 0x08,  # 20A: ADD V0, 0x08
+        0x72, 0x01,  # 20C: ADD V2, 0x01
+        0x42, 0x10,  # 20E: SNE V2, 0x10
+        0x62, 0x00,  # 210: LD V2, 0x00
+        0x30, 0x40,  # 212: SE V0, 0x40
+        0x12, 0x06,  # 214: JP 0x206
+        0x60, 0x00,  # 216: LD V0, 0x00
+        0x71, 0x06,  # 218: ADD V1, 0x06
+        0x12, 0x06,  # 21A: JP 0x206
+    ]),
+    'call': bytes([
+        0x22, 0x08,  # 200: CALL 0x208
+        0x22, 0x0C,  # 202: CALL 0x20C
+        0x12, 0x00,  # 204: JP 0x200
+        0x12, 0x06,  # 206: JP 0x206
+        0x70, 0x01,  # 208: ADD V0, 0x01
+        0x00, 0xEE,  # 20A: RET
+        0x22, 0x08,  # 20C: CALL 0x208
+        0x00, 0xEE,  # 20E: RET
+    ]),
+    'memory': bytes([
+        0xA3, 0x00,  # 200: LD I, 0x300
+        0xF3, 0x33,  # 202: LD B, V3
+        0xF2, 0x55,  # 204: LD [I], V2
+        0xF2, 0x65,  # 206: LD V2, [I]
+        0x73, 0x01,  # 208: ADD V3, 0x01
+        0xF3, 0x1E,  # 20A: ADD I, V3
+        0x12, 0x00,  # 20C: JP 0x200
+    ]),
+}
+
+def make_headless_display():
+    return HeadlessDisplay()
+
+def make_pygame_display():
+    # Nothing has to be seen, the dummy video driver still runs all of the drawing code
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from display import Display
+    display = Display()
+    display.init_display()
+    return display
+
+# The display backends that can be benchmarked
+BACKENDS = {
+    'headless': make_headless_display,
+    'pygame': make_pygame_display,
+}
+
+class TimedDisplay(object):
+    """
+    Times the draw_sprite and present calls of a display by replacing them on the instance.
+    """
+    def __init__(self, display):
+        self.draws = 0
+        self.draw_time = 0
+        self.presents = 0
+        self.present_time = 0
+        draw_sprite = display.draw_sprite
+        def timed_draw_sprite(x_coord, y_coord, sprite, sprite_width = 8):
+            start = time.perf_counter_ns()
+            collision = draw_sprite(x_coord, y_coord, sprite, sprite_width)
+            self.draw_time += time.perf_counter_ns() - start
+            self.draws += 1
+            return collision
+        display.draw_sprite = timed_draw_sprite
+        present = getattr(display, 'present', None)
+        if present is not None:
+            def timed_present():
+                start = time.perf_counter_ns()
+                present()
+                self.present_time += time.perf_counter_ns() - start
+                self.presents += 1
+            display.present = timed_present
+
+def run_frames(cpu, frames, cycles_per_frame):
+    """
+    Runs the given number of frames without sleeping, presenting the screen after every frame
+    that drew to it. Returns the number of instructions performed.
+    """
+    scheduler = Scheduler(cpu, clock_speed=cycles_per_frame * 60, realtime=False)
+    display = cpu.display
+    present = getattr(display, 'present', None)
+    for frame in range(0, frames):
+        scheduler.run_frame()
+        # The pygame display only presents when enough wall time has passed, which is never
+        # the case here, so the screen is presented directly
+        if present is not None and display.pending:
+            display.present()
+    return scheduler.cycles
+
+def benchmark(rom, engine, backend, frames = 300, cycles_per_frame = 1000, repeat = 3):
+    """
+    Runs rom, given as bytes, on an engine and display backend. Throughput is the best of
+    repeat runs. The cost of drawing and presenting is measured in one more run with both
+    timed, so the timing does not slow down the throughput runs.
+    """
+    best = None
+    for run in range(0, repeat):
+        cpu = ENGINES[engine](BACKENDS[backend](), 0)
+        cpu.load_rom_bytes(rom)
+        start = time.perf_counter()
+        instructions = run_frames(cpu, frames, cycles_per_frame)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    cpu = ENGINES[engine](BACKENDS[backend](), 0)
+    cpu.load_rom_bytes(rom)
+    timed = TimedDisplay(cpu.display)
+    run_frames(cpu, frames, cycles_per_frame)
+    return {
+        'engine': engine,
+        'backend': backend,
+        'frames': frames,
+        'instructions': instructions,
+        'seconds': round(best, 6),
+        'instructions_per_second': round(instructions / best),
+        'frames_per_second': round(frames / best, 1),
+        'draws': timed.draws,
+        'nanoseconds_per_draw': round(timed.draw_time / timed.draws) if timed.draws else None,
+        'presents': timed.presents,
+        'nanoseconds_per_present':
+            round(timed.present_time / timed.presents) if timed.presents else None,
+    }
+
+def run_suite(roms, engines, backends, frames = 300, cycles_per_frame = 1000, repeat = 3):
+    """
+    Benchmarks every rom on every engine and backend. roms maps names to rom bytes. Backends
+    that cannot be created here, such as pygame when it is not installed, are skipped and
+    listed in the results, as are the errors of roms that crash.
+    """
+    results = []
+    skipped = {}
+    for backend in backends:
+        try:
+            BACKENDS[backend]()
+        except Exception as error:
+            skipped[backend] = '%s: %s' % (type(error).__name__, error)
+    for name in sorted(roms):
+        for engine in engines:
+            for backend in backends:
+                if backend in skipped:
+                    continue
+                try:
+                    result = benchmark(roms[name], engine, backend, frames, cycles_per_frame,
+                                       repeat)
+                except Exception as error:
+                    # A real rom that crashes the emulator is recorded instead of ending the run
+                    result = {'engine': engine, 'backend': backend,
+                              'error': '%s: %s' % (type(error).__name__, error)}
+                result['rom'] = name
+                results.append(result)
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'frames': frames,
+        'cycles_per_frame': cycles_per_frame,
+        'skipped_backends': skipped,
+        'results': results,
+    }
+
+def compare(old, new):
+    """
+    Returns lines comparing the instructions per second of two sets of results.
+    """
+    old_results = dict(((result['rom'], result['engine'], result['backend']), result)
+                       for result in old['results'])
+    lines = ["%-12s %-12s %-10s %14s %14s %8s" % ("Rom", "Engine", "Backend", "Before",
+                                                   "After", "Change")]
+    for result in new['results']:
+        key = (result['rom'], result['engine'], result['backend'])
+        if key not in old_results or 'error' in result or 'error' in old_results[key]:
+            continue
+        before = old_results[key]['instructions_per_second']
+        after = result['instructions_per_second']
+        lines.append("%-12s %-12s %-10s %14d %14d %+7.1f%%" % (
+            key + (before, after, (after - before) * 100.0 / before)))
+    return "\n".join(lines)
+
+def report(suite):
+    lines = ["%-12s %-12s %-10s %14s %10s %10s" % ("Rom", "Engine", "Backend", "Instr/s",
+                                                    "Frames/s", "ns/draw")]
+    for result in suite['results']:
+        if 'error' in result:
+            lines.append("%-12s %-12s %-10s %s" % (result['rom'], result['engine'],
+                                                    result['backend'], result['error']))
+            continue
+        lines.append("%-12s %-12s %-10s %14d %10.1f %10s" % (
+            result['rom'], result['engine'], result['backend'],
+            result['instructions_per_second'], result['frames_per_second'],
+            '-' if result['nanoseconds_per_draw'] is None else result['nanoseconds_per_draw']))
+    for backend, reason in sorted(suite['skipped_backends'].items()):
+        lines.append("Skipped %s: %s" % (backend, reason))
+    return "\n".join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the Chip-8 engines and displays")
+    parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+                        help="engine to benchmark, may be given more than once (default: all)")
+    parser.add_argument('--backend', action='append', choices=sorted(BACKENDS),
+                        help="display backend to benchmark, may be given more than once "
+                             "(default: headless)")
+    parser.add_argument('--roms', default=None, metavar='DIRECTORY',
+                        help="also benchmark every rom in DIRECTORY")
+    parser.add_argument('--frames', type=int, default=300,
+                        help="frames to run per benchmark (default: 300)")
+    parser.add_argument('--cycles-per-frame', type=int, default=1000,
+                        help="instructions performed per frame (default: 1000)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="runs per benchmark, the fastest is kept (default: 3)")
+    parser.add_argument('--output', default=None,
+                        help="file to write the JSON results to")
+    parser.add_argument('--compare', default=None, metavar='FILE',
+                        help="compare the results with earlier ones written by --output")
+    args = parser.parse_args()
+
+    roms = dict(SYNTHETIC_ROMS)
+    if args.roms is not None:
+        for path in find_roms(args.roms):
+            with open(path, 'rb') as rom:
+                roms[os.path.basename(path)] = rom.read()
+    suite = run_suite(roms, args.engine or sorted(ENGINES), args.backend or ['headless'],
+                      args.frames, args.cycles_per_frame, args.repeat)
+    print(report(suite))
+    if args.output is not None:
+        with open(args.output, 'w') as output:
+            json.dump(suite, output, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as old:
+            print("")
+            print(compare(json.load(old), suite))
+    sys.exit()
@@ -1,21 +1,107 @@
 import sys
-import pygame
+import argparse
 import time
-from cpu import CPU
-from display import Display
+from engines import ENGINES
+from display import Display, load_pygame
+from scheduler import Scheduler
+from profiler import Profiler
+from keypad import Keypad
+from delta import MovieRecorder
+from replay import InputRecorder
+
+def handle_event(keypad, event):
+    """
+    Passes key events on to the keypad. Returns False if the window was closed.
+    """
+    pygame = load_pygame()
+    if event.type == pygame.QUIT:
+        return False
+    if event.type == pygame.KEYDOWN:
+        keypad.press_name(pygame.key.name(event.key))
+    elif event.type == pygame.KEYUP:
+        keypad.release_name(pygame.key.name(event.key))
+    return True
+
+def poll_events(keypad):
+    """
+    Handles the pygame events of the last frame. Returns False once the window is closed.
+    """
+    pygame = load_pygame()
+    for event in pygame.event.get():
+        if handle_event(keypad, event) is False:
+            return False
+    keypad.process()
+    return True
+
+def wait_events(keypad):
+    """
+    Sleeps until pygame has an event and handles it. Returns False if the window was closed.
+    """
+    pygame = load_pygame()
+    if handle_event(keypad, pygame.event.wait()) is False:
+        return False
+    return poll_events(keypad)
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Chippy: Chip-8 Emulator")
+    parser.add_argument('rom', help="name of the rom to run")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='interpreter',
+                        help="how opcodes are performed (default: interpreter)")
+    parser.add_argument('--clock', type=int, default=600,
+                        help="instructions performed per second (default: 600)")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="seed of the random number generator (default: random)")
+    parser.add_argument('--analyze', action='store_true',
+                        help="analyze the rom when it is loaded and prepare its code up front")
+    parser.add_argument('--trace', action='store_true',
+                        help="print every opcode and the registers")
+    parser.add_argument('--profile', default=None, metavar='FILE',
+                        help="profile the run and write the results to FILE, as collapsed "
+                             "stacks if FILE ends in .folded and as JSON otherwise")
+    parser.add_argument('--record', default=None, metavar='FILE',
+                        help="record the screen to a movie file, see delta.py to play it")
+    parser.add_argument('--record-input', default=None, metavar='FILE',
+                        help="record the key changes to an input script that replay.py can "
+                             "replay, the seed is 0 unless --seed is given")
+    args = parser.parse_args()
+    if args.record_input is not None and args.seed is None:
+        # A replay has to draw the same random numbers, so the seed has to be known
+        args.seed = 0
+
     chip8_display = Display()
     chip8_display.init_display()
-    chip8 = CPU(chip8_display) 
-    chip8.load_rom(sys.argv[1])
-    running = True
-    pygame.time.set_timer(pygame.USEREVENT + 1, 60)
-    
-    while(running):
-        chip8.perform_cycle()
-        for event in pygame.event.get():
-            if event.type == pygame.USEREVENT + 1:
-                pass
-        if chip8.memory[chip8.pc] == None:
-           sys.exit()
-
+    chip8 = ENGINES[args.engine](chip8_display, args.seed)
+    chip8.load_rom(args.rom, args.analyze)
+    chip8.test = args.trace
+    profiler = None
+    if args.profile is not None:
+        profiler = Profiler()
+        profiler.attach(chip8)
+    recorder = None
+    if args.record is not None:
+        recorder = MovieRecorder(args.record)
+    scheduler = Scheduler(chip8, clock_speed=args.clock, recorder=recorder)
+    input_recorder = None
+    if args.record_input is not None:
+        input_recorder = InputRecorder(scheduler)
+    keypad = Keypad(chip8, recorder=input_recorder)
+    status = 0
+    try:
+        scheduler.run(poll_events=lambda: poll_events(keypad),
+                      wait_events=lambda: wait_events(keypad))
+    except ValueError as error:
+        # The rom reached an opcode chippy cannot perform
+        print(error)
+        status = 1
+    if recorder is not None:
+        recorder.close()
+    if input_recorder is not None:
+        input_recorder.save(args.record_input, "recorded with --seed %d --clock %d"
+                            % (args.seed, args.clock))
+    if profiler is not None:
+        print(profiler.report())
+        if args.profile.endswith('.folded'):
+            profiler.dump_collapsed(args.profile)
+        else:
+            profiler.dump_json(args.profile)
+    sys.exit(status)
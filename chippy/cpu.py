@@ -1,5 +1,50 @@
 import os
+import sys
 import random
+import struct
+from array import array
+
+# Roms are looked up by name in the roms directory next to the chippy package
+ROM_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'roms')
+
+# Layout of the fixed size fields at the start of a snapshot: magic, version, pc, I, sp,
+# delay timer, sound timer, register waiting for a key (0xFF if none), screen width and
+# screen height
+SNAPSHOT_HEADER = struct.Struct('<4sBHHBBBBHH')
+SNAPSHOT_MAGIC = b'CHP8'
+SNAPSHOT_VERSION = 3
+
+# State of the random number generator in a snapshot: the version of the generator, its 625
+# words of internal state, whether a Gaussian value is cached and that value
+RNG_STATE = struct.Struct('<B625I?d')
+
+# Screen sizes of the Chip-8 and of the Super-CHIP high resolution mode
+LOW_RESOLUTION = (64, 32)
+HIGH_RESOLUTION = (128, 64)
+
+# Sprites for the hex digits 0~F, stored at the start of memory
+FONT_SET = bytes([
+    0xF0, 0x90, 0x90, 0x90, 0xF0, # 0
+    0x20, 0x60, 0x20, 0x20, 0x70, # 1
+    0xF0, 0x10, 0xF0, 0x80, 0xF0, # 2
+    0xF0, 0x10, 0xF0, 0x10, 0xF0, # 3
+    0x90, 0x90, 0xF0, 0x10, 0x10, # 4 
+    0xF0, 0x80, 0xF0, 0x10, 0xF0, # 5 
+    0xF0, 0x80, 0xF0, 0x90, 0xF0, # 6 
+    0xF0, 0x10, 0x20, 0x40, 0x40, # 7 
+    0xF0, 0x90, 0xF0, 0x90, 0xF0, # 8 
+    0xF0, 0x90, 0xF0, 0x10, 0xF0, # 9
+    0xF0, 0x90, 0xF0, 0x90, 0x90, # A 
+    0xE0, 0x90, 0xE0, 0x90, 0xE0, # B 
+    0xF0, 0x80, 0x80, 0x80, 0xF0, # C
+    0xE0, 0x90, 0x90, 0x90, 0xE0, # D
+    0xF0, 0x80, 0xF0, 0x80, 0xF0, # E
+    0xF0, 0x80, 0xF0, 0x80, 0x80  # F
+    ])
+
+# Memory as every CPU starts out: the font set in the area reserved for the interpreter and
+# zeros everywhere else. Each CPU copies it in one go instead of building its memory up.
+BOOT_IMAGE = FONT_SET + bytes(4096 - len(FONT_SET))
 
 class CPU(object):
     """
@@ -9,16 +54,21 @@ class CPU(object):
     are the delay and sound timers. The stack can hold 16 16-bit values. The Chip-8 had a 16-bit
     keypad from 0~9 and A~F.
     """
-    def __init__(self, display):
+    __slots__ = ('memory', 'registers', 'stack', 'keys', 'pc', 'sp', 'register_I',
+                 'delay_timer', 'sound_timer', 'display', 'draw', 'test', 'profiler', 'rng', 'waiting_key',
+                 'analysis')
+
+    def __init__(self, display, seed = None):
         """
-        Initializes all the needed components of the Chip-8 CPU to their proper values
+        Initializes all the needed components of the Chip-8 CPU to their proper values. Memory,
+        registers and keys are bytearrays so a register can never hold more than 8 bits, and the
+        stack is an array of 16-bit values. Every CPU has its own random number generator so
+        runs with the same seed are the same every time.
         """
-        self.memory = [0] * 4096  
-        self.registers = [0] * 16
-        self.address = [0] * 16
-        self.stack = [0] * 16
-        self.keys = [0] * 16
-        self.display_pixels = [[0 for _ in range(64)] for _ in range(32)] 
+        self.memory = bytearray(BOOT_IMAGE)
+        self.registers = bytearray(16)
+        self.stack = array('H', [0] * 16)
+        self.keys = bytearray(16)
         self.pc = 0x200
         self.sp = 0
         self.register_I = 0
@@ -26,29 +76,15 @@ class CPU(object):
         self.sound_timer = 0
         self.display = display
         self.draw = False
-        self.test = True
-        
-        self.font_set = [
-            0xF0, 0x90, 0x90, 0x90, 0xF0, # 0
-            0x20, 0x60, 0x20, 0x20, 0x70, # 1
-            0xF0, 0x10, 0xF0, 0x80, 0xF0, # 2
-            0xF0, 0x10, 0xF0, 0x10, 0xF0, # 3
-            0x90, 0x90, 0xF0, 0x10, 0x10, # 4 
-            0xF0, 0x80, 0xF0, 0x10, 0xF0, # 5 
-            0xF0, 0x80, 0xF0, 0x90, 0xF0, # 6 
-            0xF0, 0x10, 0x20, 0x40, 0x40, # 7 
-            0xF0, 0x90, 0xF0, 0x90, 0xF0, # 8 
-            0xF0, 0x90, 0xF0, 0x10, 0xF0, # 9
-            0xF0, 0x90, 0xF0, 0x90, 0x90, # A 
-            0xE0, 0x90, 0xE0, 0x90, 0xE0, # B 
-            0xF0, 0x80, 0x80, 0x80, 0xF0, # C
-            0xE0, 0x90, 0x90, 0x90, 0xE0, # D
-            0xF0, 0x80, 0xF0, 0x80, 0xF0, # E
-            0xF0, 0x80, 0xF0, 0x80, 0x80  # F
-            ]
-
-        for x in range(0, len(self.font_set)):
-            self.memory[x] = self.font_set[x]
+        # Prints every opcode and the registers when True
+        self.test = False
+        # Set by Profiler.attach to time every opcode
+        self.profiler = None
+        self.rng = random.Random(seed)
+        # The register FX0A stores the next key pressed in, None when not waiting for a key
+        self.waiting_key = None
+        # Static analysis of the loaded rom, None unless asked for when loading it
+        self.analysis = None
 
     def testing(self):
         for num in range (0, len(self.registers)):
@@ -58,32 +94,124 @@ class CPU(object):
         print("sp: " + str(self.sp))
         print("dt: " + str(self.delay_timer))
         print("st: " + str(self.sound_timer))
-    def load_rom(self, rom_name):
+    def load_rom(self, rom_name, analyze = False):
         """
         Checks if the user entered rom name exists in the proper directory. If the rom exists
         and is a valid Chip-8 rom, it is stored into the proper addresses in the CPU memory.
+        If analyze is True the rom is analyzed once it is loaded, see load_rom_bytes.
         """
         print("Loading %s..." % (rom_name))
-        os.chdir('..')
-        os.chdir('roms')
+        path = os.path.join(ROM_DIRECTORY, rom_name)
+        if not os.path.isfile(path):
+            path = rom_name
         try:
-            rom = open(rom_name, "rb")
+            self.load_rom_file(path, analyze)
         except IOError:
             print("Rom does not exist, please enter a valid rom file.")
             sys.exit()
-        else:
-            rom_bytes = rom.read()
-            # First 512 bytes are used by the Chip-8 font set.
-            if len(rom_bytes) > (4096 - 512):
-                print("Rom file is too large, please choose a valid rom file.")
-            #print(len(rom_string))
-            # Loads rom into memory starting from the address after the first 512 addresses
-            for byte in range(0, len(rom_bytes)):
-                self.memory[byte + self.pc] = rom_bytes[byte]
-            print("Done loading %s!" %(rom_name))
-            rom.close()
+        except ValueError:
+            print("Rom file is too large, please choose a valid rom file.")
+            sys.exit()
+        print("Done loading %s!" %(rom_name))
+
+    def load_rom_file(self, path, analyze = False):
+        """
+        Loads the rom at the given path into memory. Unlike load_rom nothing is printed and the
+        working directory is left alone, so it is safe to use from many emulators at once.
+        """
+        with open(path, "rb") as rom:
+            self.load_rom_bytes(rom.read(), analyze)
+
+    def load_rom_bytes(self, rom_bytes, analyze = False):
+        """
+        Stores the bytes of a rom in memory starting from address 0x200. Raises ValueError if
+        the rom does not fit in memory. If analyze is True the control flow of the rom is
+        analyzed and stored in analysis, and the engine gets to prepare the reachable code
+        before the first instruction is performed.
+        """
+        # First 512 bytes are used by the Chip-8 font set.
+        if len(rom_bytes) > (4096 - 512):
+            raise ValueError("Rom is too large: %d bytes" % len(rom_bytes))
+        # Loads rom into memory starting from the address after the first 512 addresses
+        self.memory[0x200:0x200 + len(rom_bytes)] = rom_bytes
+        self.analysis = None
+        if analyze:
+            # Only imported when asked for, most runs never analyze a rom
+            from analyzer import analyze as analyze_rom
+            self.analysis = analyze_rom(self.memory, 0x200, 0x200 + len(rom_bytes))
+            self.prepare(self.analysis)
+
+    def prepare(self, analysis):
+        """
+        Called with the analysis of a newly loaded rom. The interpreter decodes every opcode
+        as it goes so there is nothing to prepare.
+        """
+        pass
+
+    def snapshot(self):
+        """
+        Returns the whole state of the machine as bytes: the header fields followed by the
+        registers, the stack, the keys, the state of the random number generator, memory and
+        the screen. Passing the bytes to restore puts this or any other CPU back into exactly
+        this state, so runs continued from the same snapshot are the same on every CPU.
+        """
+        framebuffer = self.display.framebuffer
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, self.pc,
+                                      self.register_I, self.sp, self.delay_timer,
+                                      self.sound_timer,
+                                      0xFF if self.waiting_key is None else self.waiting_key,
+                                      framebuffer.width, framebuffer.height)
+        stack = array('H', self.stack)
+        if sys.byteorder != 'little':
+            stack.byteswap()
+        rng_version, rng_words, gauss = self.rng.getstate()
+        rng_state = RNG_STATE.pack(rng_version, *rng_words, gauss is not None,
+                                   0.0 if gauss is None else gauss)
+        return b''.join((header, self.registers, stack.tobytes(), self.keys, rng_state,
+                         self.memory, framebuffer.to_bytes()))
+
+    def restore(self, snapshot):
+        """
+        Puts the machine back into the state saved by snapshot, switching the display to the
+        resolution it was taken at. Raises ValueError if the bytes are not a snapshot.
+        """
+        (magic, version, pc, register_I, sp, delay_timer, sound_timer, waiting_key,
+         width, height) = SNAPSHOT_HEADER.unpack_from(snapshot, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("Not a chippy snapshot")
+        framebuffer = self.display.framebuffer
+        if (width, height) != (framebuffer.width, framebuffer.height):
+            self.display.set_resolution(width, height)
+        offset = SNAPSHOT_HEADER.size
+        self.registers[:] = snapshot[offset:offset + 16]
+        offset += 16
+        stack = array('H')
+        stack.frombytes(snapshot[offset:offset + 32])
+        if sys.byteorder != 'little':
+            stack.byteswap()
+        self.stack[:] = stack
+        offset += 32
+        self.keys[:] = snapshot[offset:offset + 16]
+        offset += 16
+        rng_state = RNG_STATE.unpack_from(snapshot, offset)
+        self.rng.setstate((rng_state[0], rng_state[1:626],
+                           rng_state[627] if rng_state[626] else None))
+        offset += RNG_STATE.size
+        self.memory[:] = snapshot[offset:offset + len(self.memory)]
+        offset += len(self.memory)
+        self.display.load_screen(snapshot[offset:])
+        self.pc = pc
+        self.register_I = register_I
+        self.sp = sp
+        self.delay_timer = delay_timer
+        self.sound_timer = sound_timer
+        self.waiting_key = None if waiting_key == 0xFF else waiting_key
+        self.draw = True
 
     def timer_decrement(self):
+        """
+        Decrements the delay and sound timers if they are not 0. Called 60 times a second.
+        """
         if self.delay_timer != 0:
             self.delay_timer -= 1
         if self.sound_timer != 0:
@@ -110,17 +238,53 @@ class CPU(object):
         first_hex = opcode & 0xF000
         if first_hex == 0x0000:
             last_hex = opcode & 0x000F
+            # Opcode 00CN: Scroll the screen down N lines (Super-CHIP)
+            if opcode & 0xFFF0 == 0x00C0:
+                self.display.scroll_down(last_hex)
+                self.draw = True
+                self.pc += 2
+            # Opcode 00DN: Scroll the screen up N lines (XO-CHIP)
+            elif opcode & 0xFFF0 == 0x00D0:
+                self.display.scroll_up(last_hex)
+                self.draw = True
+                self.pc += 2
+            # Opcode 00FB: Scroll the screen right 4 pixels (Super-CHIP)
+            elif opcode == 0x00FB:
+                self.display.scroll_right(4)
+                self.draw = True
+                self.pc += 2
+            # Opcode 00FC: Scroll the screen left 4 pixels (Super-CHIP)
+            elif opcode == 0x00FC:
+                self.display.scroll_left(4)
+                self.draw = True
+                self.pc += 2
+            # Opcode 00FD: Exit the interpreter, the pc stays here (Super-CHIP)
+            elif opcode == 0x00FD:
+                pass
+            # Opcode 00FE: Switch to the 64x32 screen (Super-CHIP)
+            elif opcode == 0x00FE:
+                self.display.set_resolution(*LOW_RESOLUTION)
+                self.draw = True
+                self.pc += 2
+            # Opcode 00FF: Switch to the 128x64 screen (Super-CHIP)
+            elif opcode == 0x00FF:
+                self.display.set_resolution(*HIGH_RESOLUTION)
+                self.draw = True
+                self.pc += 2
             # Opcode 00E0: clear screen
-            if last_hex == 0x0000:
+            elif opcode == 0x00E0:
                 self.display.clear_display()
                 self.draw = True
                 self.pc += 2 
             # Opcode 00EE: returns from subroutine
-            elif last_hex == 0x000E: 
+            elif opcode == 0x00EE: 
                 self.sp -= 1
                 self.pc = self.stack[self.sp]
                 #self.sp -= 1
                 self.pc += 2
+            # Opcode 0NNN: Jump to a machine code routine at NNN, ignored by modern interpreters
+            else:
+                self.pc += 2
 
         # Opcode 1NNN: Jump to address NNN        
         elif first_hex == 0x1000:
@@ -150,7 +314,7 @@ class CPU(object):
                 self.pc += 2
 
         # Opcode 5XY0: Skips next instruction if value stored in register X = value in register Y    
-        elif first_hex == 0x5000:
+        elif first_hex == 0x5000 and (opcode & 0x000F) == 0x0000:
             if (self.registers[(opcode & 0x0F00) >> 8] == self.registers[(opcode & 0x00F0) >> 4]):
                 self.pc += 4
             else:
@@ -164,7 +328,7 @@ class CPU(object):
 
         # Opcode 7XKK: Adds KK to the value in register X and stores it in register X
         elif first_hex == 0x7000:
-            self.registers[(opcode & 0x0F00) >> 8] += (opcode & 0x00FF)
+            self.registers[(opcode & 0x0F00) >> 8] = (self.registers[(opcode & 0x0F00) >> 8] + (opcode & 0x00FF)) & 0xFF
             self.pc += 2
 
         elif first_hex == 0x8000:
@@ -203,7 +367,7 @@ class CPU(object):
                     self.registers[0xF] = 1
                 else: 
                     self.registers[0xF] = 0
-                self.registers[(opcode & 0x0F00) >> 8] -= self.registers[(opcode & 0x00F0) >> 4]
+                self.registers[(opcode & 0x0F00) >> 8] = (self.registers[(opcode & 0x0F00) >> 8] - self.registers[(opcode & 0x00F0) >> 4]) & 0xFF
                 self.pc += 2
             # Opcode 8XY6: Right shift the value of register X by 1
             elif last_hex == 0x006:
@@ -218,17 +382,19 @@ class CPU(object):
                     self.registers[0xF] = 1
                 else:
                     self.registers[0xF] = 0
-                self.registers[(opcode & 0x0F00) >> 8] = self.registers[(opcode & 0x00F0) >> 4] - self.registers[(opcode & 0x0F00) >> 8]
+                self.registers[(opcode & 0x0F00) >> 8] = (self.registers[(opcode & 0x00F0) >> 4] - self.registers[(opcode & 0x0F00) >> 8]) & 0xFF
                 self.pc += 2
             # Opcode 8XYE: Left shift the value of register X by 1
             elif last_hex == 0x00E:
                 # Keeps the most significant bit of the value of register X in register F
                 self.registers[0xF] = (self.registers[(opcode & 0x0F00) >> 8] >> 7)
-                self.registers[(opcode & 0x0F00) >> 8] = (self.registers[(opcode & 0x0F00) >> 8] << 1)
+                self.registers[(opcode & 0x0F00) >> 8] = (self.registers[(opcode & 0x0F00) >> 8] << 1) & 0xFF
                 self.pc += 2
+            else:
+                self.invalid_opcode(opcode)
 
         # Opcode 9XY0: Skip next instruction if value of register X != value of register Y
-        elif first_hex == 0x9000:
+        elif first_hex == 0x9000 and (opcode & 0x000F) == 0x0000:
             if self.registers[(opcode & 0x0F00) >> 8] != self.registers[(opcode & 0x00F0) >> 4]:
                 self.pc += 4
             else:
@@ -245,7 +411,7 @@ class CPU(object):
 
         # Opcode CXKK: Sets the value of register X to (random byte AND KK)
         elif first_hex == 0xC000:
-            random_byte = random.randint(0, 255) 
+            random_byte = self.rng.randint(0, 255)
             self.registers[(opcode & 0x0F00) >> 8] = (random_byte & (opcode & 0x00FF))
             self.pc += 2
     
@@ -255,126 +421,162 @@ class CPU(object):
         # bit. Set value of register F to 1 if collision else set it to 0
 
         elif first_hex == 0xD000:
-            height = opcode & 0x000F
             x_coord = self.registers[(opcode & 0x0F00) >> 8]
             y_coord = self.registers[(opcode & 0x00F0) >> 4]
-            location = self.register_I
-            self.registers[0xF] = 0
-            sprite_list = []
-            print(str(height)) 
-            for offset in range(0, height):
-                sprite_bits = []
-                sprite_byte = self.memory[location + offset]
-                sprite_byte = (bin(sprite_byte)[2:]).zfill(8) 
-                for bit in sprite_byte:
-                    sprite_bits.append(bit)
-                sprite_list.append(sprite_bits)
-            """
-            for sprite in sprite_list:
-                    print(str(sprite))
-            """
-            for sprite in range(len(sprite_list)):
-                increment = 0
-                for pixel in sprite_list[sprite]:
-                    screen_pixel = self.display.check_pixel((x_coord + increment) % self.display.width, (y_coord + sprite) % self.display.height)
-                    pixel_color = int(pixel)
-                    if pixel_color == 1 and screen_pixel == 1:
-                        self.registers[0xF] = 1
-                        pixel_color = 0
-                    elif pixel_color == 0 and screen_pixel == 1:
-                        pixel_color = 1
-                    self.display.set_pixel((x_coord + increment) % self.display.width, (y_coord + sprite) % self.display.height, pixel_color)
-                    increment += 1
-            self.draw = True
+            self.draw_sprite(x_coord, y_coord, opcode & 0x000F)
             self.pc += 2
 
-
         elif first_hex == 0xE000:
-            last_hex = opcode & 0x000F
-            # TODO implement pygame keys
             # Opcode EX9E: Skips the next instruction if key with the value of register X is pressed
-            if last_hex == 0x000E:
+            if (opcode & 0x00FF) == 0x009E:
                 if self.keys[(opcode & 0x0F00) >> 8] != 0:
                     self.pc += 4
                 else:
                     self.pc += 2
             # Opcode EXA1: Skips the next instruction if key with the value of register X is not pressed
-            if last_hex == 0x0001:
+            elif (opcode & 0x00FF) == 0x00A1:
                 if self.keys[(opcode & 0x0F00) >> 8] == 0:
                     self.pc += 4
                 else:
                     self.pc +=2
+            else:
+                self.invalid_opcode(opcode)
         
         elif first_hex == 0xF000:
-            last_hex = opcode & 0x000F
             # Opcode FX07: Set the value of register X to the value of the delay timer
-            if last_hex == 0x0007:
+            if (opcode & 0x00FF) == 0x0007:
                 self.registers[(opcode & 0x0F00) >> 8] = self.delay_timer
                 self.pc += 2
-            # TODO implement pygame keys
             # Opcode FX0A: Wait for a key press and stores the value of the pressed key into register X
-            if last_hex == 0x000A:
-                key_was_pressed = False
-                while key_was_pressed is not True:
-                    for key in range(0, len(self.keys)):
-                        if key is not 0:
-                            self.registers[(opcode & 0x0F00) >> 8] = key
-                            key_was_pressed = True
+            # The CPU halts until press_key is called, which stores the key in register X
+            elif (opcode & 0x00FF) == 0x000A:
+                self.waiting_key = (opcode & 0x0F00) >> 8
                 self.pc += 2
             # Opcode FX15: Set the value of the delay timer to the value of register X
-            if (opcode & 0x00FF) == 0x0015:
+            elif (opcode & 0x00FF) == 0x0015:
                 self.delay_timer = self.registers[(opcode & 0x0F00) >> 8] 
                 self.pc += 2
             # Opcode FX18: Set the value of the sound timer to the value of register X
-            if last_hex == 0x0008:
+            elif (opcode & 0x00FF) == 0x0018:
                 self.sound_timer = self.registers[(opcode & 0x0F00) >> 8]
                 self.pc += 2
             # Opcode FX1E: Set the value of register I to (value of register I + value of register X)
-            if last_hex == 0x000E:
-                self.register_I += self.registers[(opcode & 0x0F00) >> 8]
+            elif (opcode & 0x00FF) == 0x001E:
+                self.register_I = (self.register_I + self.registers[(opcode & 0x0F00) >> 8]) & 0xFFFF
                 self.pc += 2
             # Opcode FX29: Set value of register I to the location of sprite for the digit of the value of register X
             # Sprites are 5 bytes long so the value of register X must be multiplied by 5
-            if last_hex == 0x0009:
+            elif (opcode & 0x00FF) == 0x0029:
                 self.register_I = self.registers[(opcode & 0x0F00) >> 8] * 0x5
                 self.pc += 2
             # Opcode FX33: Store the binary-coded decimal representation of the value of register X in memory locations I, I+1, and I+2
-            if last_hex == 0x0003:
+            elif (opcode & 0x00FF) == 0x0033:
                 value = self.registers[(opcode & 0x0F00) >> 8] 
+                digits = [0, 0, 0]
                 difference = 2
                 while difference >= 0:
-                    self.memory[self.register_I + difference] = value % 10
+                    digits[difference] = value % 10
                     value = value // 10
                     difference -= 1
+                self.write_memory(self.register_I, digits)
                 self.pc += 2
             # Opcode Fx55: Store the values of register 0 through X in memory starting in location of the value of register I
-            if (opcode & 0x00FF) == 0x0055:
-                location = 0
+            elif (opcode & 0x00FF) == 0x0055:
                 end = (opcode & 0x0F00) >> 8
-                while location <= end:
-                    self.memory[self.register_I + location] = self.registers[location]
-                    location += 1
+                self.write_memory(self.register_I, self.registers[0:end + 1])
                 self.pc += 2
             # Opcode FX65: Load the registers 0 through X with values starting from the address of the value of register I
-            if (opcode & 0x00FF) == 0x0065:
-                location = 0
+            elif (opcode & 0x00FF) == 0x0065:
                 end = (opcode & 0x0F00) >> 8
-                while location <= end:
-                    self.registers[location] = self.memory[self.register_I + location]
-                    location += 1
+                self.registers[0:end + 1] = self.read_memory(self.register_I, end + 1)
                 self.pc += 2
+            else:
+                self.invalid_opcode(opcode)
         else:
-            print("Invalid opcode, chippy will now quit")
-            quit()
+            self.invalid_opcode(opcode)
+
+    def invalid_opcode(self, opcode):
+        """
+        Raises ValueError for an opcode that is not a Chip-8 or Super-CHIP instruction.
+        """
+        raise ValueError("Invalid opcode 0x%04X at 0x%03X" % (opcode, self.pc))
+
+    def read_memory(self, address, length):
+        """
+        Returns length consecutive bytes of memory starting at address. Raises IndexError
+        instead of returning fewer bytes when the read runs past the end of memory.
+        """
+        if address + length > len(self.memory):
+            raise IndexError("memory read past the end of memory")
+        return self.memory[address:address + length]
+
+    def write_memory(self, address, values):
+        """
+        Stores the given values in consecutive memory addresses starting at address. Opcodes
+        that write to memory go through here so engines that cache code can see the writes.
+        """
+        if address + len(values) > len(self.memory):
+            raise IndexError("memory write past the end of memory")
+        self.memory[address:address + len(values)] = bytes(values)
+
+    def draw_sprite(self, x_coord, y_coord, height):
+        """
+        Draws the sprite of the given height stored at memory location I at (x_coord, y_coord).
+        Each row of the sprite is one byte that is XORed with the screen by the display, wrapping
+        around the edges of the display. A height of 0 draws a Super-CHIP 16x16 sprite, two
+        bytes per row. Register F is set to 1 if a pixel is erased.
+        """
+        location = self.register_I
+        if height == 0:
+            data = self.memory[location:location + 32]
+            sprite = [data[offset] << 8 | data[offset + 1] for offset in range(0, len(data) - 1, 2)]
+            self.registers[0xF] = self.display.draw_sprite(x_coord, y_coord, sprite, 16)
+        else:
+            sprite = self.memory[location:location + height]
+            self.registers[0xF] = self.display.draw_sprite(x_coord, y_coord, sprite)
+        self.draw = True
 
     def perform_cycle(self):
+        """
+        Performs the opcode at the pc and returns the number of instructions performed. The
+        timers are not decremented here since they count down at 60 Hz no matter how fast the
+        CPU runs, see Scheduler. Nothing is performed while the CPU is waiting for a key.
+        """
+        if self.waiting_key is not None:
+            return 0
         current_opcode = self.get_opcode()
-        print(hex(current_opcode))
         if self.test == True:
+            print(hex(current_opcode))
             self.testing()
-        self.perform_opcode(current_opcode)
-        self.timer_decrement()
+        if self.profiler is None:
+            self.perform_opcode(current_opcode)
+        else:
+            self.profiler.profile_opcode(self, current_opcode)
         if self.draw == True:
             self.display.update_display()
             self.draw = False
+        return 1
+
+    def run_cycles(self, count):
+        """
+        Performs count instructions and returns the number performed, which is less than count
+        if the CPU starts waiting for a key.
+        """
+        performed = 0
+        while performed < count and self.waiting_key is None:
+            performed += self.perform_cycle()
+        return performed
+
+    def press_key(self, key):
+        """
+        Marks the key as pressed. If the CPU is waiting for a key the key is stored in the
+        register given to FX0A and the CPU carries on.
+        """
+        self.keys[key] = 1
+        if self.waiting_key is not None:
+            self.registers[self.waiting_key] = key
+            self.waiting_key = None
+
+    def release_key(self, key):
+        self.keys[key] = 0
     
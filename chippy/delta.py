@@ -0,0 +1,249 @@
+"""
+Compact encoding of screen updates for recording and streaming. Only the rows that changed
+since the last encoded screen are sent, each as the XOR of its old and new value with the
+zero bytes left out, so a typical frame costs a few bytes instead of a whole 64x32 screen.
+
+A stream, which is also the format of a movie file, is a header followed by packets:
+
+    header    b'C8MV', version byte, frame rate byte
+    packet    varint length, then the packet:
+                varint number of frames since the previous packet
+                kind byte
+                KEYFRAME: width and height as 16-bit little endian, then every row
+                DELTA:    one bit per row saying whether it changed, then for every changed
+                          row a mask with one bit per byte of the row saying which bytes of
+                          the XOR are not zero, followed by those bytes
+
+Rows are stored big endian with the left most pixel in the most significant bit, like
+FrameBuffer.to_bytes. Keyframes are sent first, whenever the screen changes size and every
+keyframe_interval packets so a player can start from them.
+
+    python delta.py info MOVIE
+    python delta.py play MOVIE
+"""
+import time
+import struct
+import argparse
+
+MOVIE_MAGIC = b'C8MV'
+MOVIE_VERSION = 1
+KEYFRAME = 0
+DELTA = 1
+SIZE = struct.Struct('<HH')
+
+def write_varint(output, value):
+    while value >= 0x80:
+        output.append((value & 0x7F) | 0x80)
+        value >>= 7
+    output.append(value)
+
+def read_varint(data, offset):
+    """
+    Returns the varint at offset in data and the offset just past it.
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+def stream_header(frame_rate = 60):
+    return MOVIE_MAGIC + bytes((MOVIE_VERSION, frame_rate))
+
+class FrameEncoder(object):
+    """
+    Turns screens into packets holding only what changed since the last screen encoded.
+    """
+    def __init__(self, keyframe_interval = 600):
+        self.keyframe_interval = keyframe_interval
+        self.rows = None
+        self.width = None
+        self.height = None
+        self.packets = 0
+        self.last_frame = 0
+
+    def encode(self, framebuffer, frame = None):
+        """
+        Returns the packet for the screen in framebuffer, or None if nothing changed. frame is
+        the number of the frame the screen belongs to, used to keep the timing of a movie.
+        """
+        if frame is None:
+            frame = self.last_frame + 1
+        rows = framebuffer.rows
+        keyframe = (self.rows is None or framebuffer.width != self.width
+                    or framebuffer.height != self.height
+                    or self.packets % self.keyframe_interval == 0)
+        if not keyframe and rows == self.rows:
+            return None
+        packet = bytearray()
+        write_varint(packet, frame - self.last_frame)
+        row_bytes = (framebuffer.width + 7) // 8
+        if keyframe:
+            packet.append(KEYFRAME)
+            packet += SIZE.pack(framebuffer.width, framebuffer.height)
+            for row in rows:
+                packet += row.to_bytes(row_bytes, 'big')
+        else:
+            packet.append(DELTA)
+            changed = bytearray((len(rows) + 7) // 8)
+            body = bytearray()
+            for y in range(0, len(rows)):
+                difference = rows[y] ^ self.rows[y]
+                if difference:
+                    changed[y >> 3] |= 0x80 >> (y & 7)
+                    xor = difference.to_bytes(row_bytes, 'big')
+                    mask = bytearray((row_bytes + 7) // 8)
+                    for index in range(0, row_bytes):
+                        if xor[index]:
+                            mask[index >> 3] |= 0x80 >> (index & 7)
+                    body += mask
+                    body += bytes(byte for byte in xor if byte)
+            packet += changed
+            packet += body
+        self.rows = list(rows)
+        self.width = framebuffer.width
+        self.height = framebuffer.height
+        self.packets += 1
+        self.last_frame = frame
+        return bytes(packet)
+
+class FrameDecoder(object):
+    """
+    Rebuilds screens from packets made by FrameEncoder.
+    """
+    def __init__(self):
+        self.rows = None
+        self.width = None
+        self.height = None
+        self.frame = 0
+
+    def decode(self, packet):
+        """
+        Applies a packet to the screen and returns the list of rows it changed.
+        """
+        frames, offset = read_varint(packet, 0)
+        self.frame += frames
+        kind = packet[offset]
+        offset += 1
+        if kind == KEYFRAME:
+            self.width, self.height = SIZE.unpack_from(packet, offset)
+            offset += SIZE.size
+            row_bytes = (self.width + 7) // 8
+            self.rows = [int.from_bytes(packet[start:start + row_bytes], 'big')
+                         for start in range(offset, offset + row_bytes * self.height, row_bytes)]
+            return list(range(0, self.height))
+        if kind != DELTA or self.rows is None:
+            raise ValueError("Delta packet without a keyframe before it")
+        row_bytes = (self.width + 7) // 8
+        mask_bytes = (row_bytes + 7) // 8
+        changed_rows = []
+        changed = packet[offset:offset + (self.height + 7) // 8]
+        offset += len(changed)
+        for y in range(0, self.height):
+            if not changed[y >> 3] & (0x80 >> (y & 7)):
+                continue
+            mask = packet[offset:offset + mask_bytes]
+            offset += mask_bytes
+            xor = bytearray(row_bytes)
+            for index in range(0, row_bytes):
+                if mask[index >> 3] & (0x80 >> (index & 7)):
+                    xor[index] = packet[offset]
+                    offset += 1
+            self.rows[y] ^= int.from_bytes(xor, 'big')
+            changed_rows.append(y)
+        return changed_rows
+
+class MovieRecorder(object):
+    """
+    Writes the screens of a run to a movie file. Pass it to a Scheduler as recorder to record
+    every frame, only frames where the screen changed take up space.
+    """
+    def __init__(self, path, frame_rate = 60, keyframe_interval = 600):
+        self.output = open(path, 'wb')
+        self.output.write(stream_header(frame_rate))
+        self.encoder = FrameEncoder(keyframe_interval)
+
+    def record(self, frame, framebuffer):
+        packet = self.encoder.encode(framebuffer, frame)
+        if packet is not None:
+            length = bytearray()
+            write_varint(length, len(packet))
+            self.output.write(length)
+            self.output.write(packet)
+
+    def close(self):
+        self.output.close()
+
+class MoviePlayer(object):
+    """
+    Reads a movie file. Iterating over it yields (frame number, decoder) for every packet,
+    with the decoder holding the screen as of that frame.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as movie:
+            self.data = movie.read()
+        if self.data[:4] != MOVIE_MAGIC or self.data[4] != MOVIE_VERSION:
+            raise ValueError("%s is not a chippy movie" % path)
+        self.frame_rate = self.data[5]
+
+    def packets(self):
+        offset = 6
+        while offset < len(self.data):
+            length, offset = read_varint(self.data, offset)
+            yield self.data[offset:offset + length]
+            offset += length
+
+    def __iter__(self):
+        decoder = FrameDecoder()
+        for packet in self.packets():
+            decoder.decode(packet)
+            yield decoder.frame, decoder
+
+def play(path, scale = 10):
+    """
+    Shows a movie in a pygame window at the speed it was recorded.
+    """
+    from display import Display
+    player = MoviePlayer(path)
+    display = None
+    start = time.monotonic()
+    for frame, decoder in player:
+        if display is None:
+            display = Display(decoder.width, decoder.height, scale)
+            display.init_display()
+        elif (display.width, display.height) != (decoder.width, decoder.height):
+            display.set_resolution(decoder.width, decoder.height)
+        display.framebuffer.rows = list(decoder.rows)
+        display.dirty_rows.update(range(0, decoder.height))
+        delay = start + frame / player.frame_rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        display.present()
+
+def info(path):
+    player = MoviePlayer(path)
+    packets = 0
+    keyframes = 0
+    frame = 0
+    for packet in player.packets():
+        packets += 1
+        frames, offset = read_varint(packet, 0)
+        frame += frames
+        if packet[offset] == KEYFRAME:
+            keyframes += 1
+    print("%s: %d bytes, %d frames at %d Hz, %d packets (%d keyframes)"
+          % (path, len(player.data), frame, player.frame_rate, packets, keyframes))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inspect or play a chippy movie")
+    parser.add_argument('command', choices=['info', 'play'])
+    parser.add_argument('movie', help="path of the movie file")
+    args = parser.parse_args()
+    if args.command == 'info':
+        info(args.movie)
+    else:
+        play(args.movie)
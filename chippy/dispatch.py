@@ -0,0 +1,395 @@
+"""
+Table driven opcode dispatch for the Chip-8 CPU. Every one of the 65536 possible opcodes is
+decoded once into a handler function and its pre-decoded X, Y, N, KK and NNN fields so that
+executing an instruction is a single table lookup and a function call instead of walking the
+if/elif chain in CPU.perform_opcode.
+
+Each handler is called as handler(cpu, x, y, n, kk, nnn) where:
+    x   - the second hex of the opcode (register X)
+    y   - the third hex of the opcode (register Y)
+    n   - the last hex of the opcode
+    kk  - the last byte of the opcode
+    nnn - the last 3 hex values of the opcode (an address)
+"""
+from cpu import CPU, LOW_RESOLUTION, HIGH_RESOLUTION
+
+# Opcode 00E0: clear screen
+def op_00e0(cpu, x, y, n, kk, nnn):
+    cpu.display.clear_display()
+    cpu.draw = True
+    cpu.pc += 2
+
+# Opcode 00EE: returns from subroutine
+def op_00ee(cpu, x, y, n, kk, nnn):
+    cpu.sp -= 1
+    cpu.pc = cpu.stack[cpu.sp] + 2
+
+# Opcode 00CN: Scroll the screen down N lines (Super-CHIP)
+def op_00cn(cpu, x, y, n, kk, nnn):
+    cpu.display.scroll_down(n)
+    cpu.draw = True
+    cpu.pc += 2
+
+# Opcode 00DN: Scroll the screen up N lines (XO-CHIP)
+def op_00dn(cpu, x, y, n, kk, nnn):
+    cpu.display.scroll_up(n)
+    cpu.draw = True
+    cpu.pc += 2
+
+# Opcode 00FB: Scroll the screen right 4 pixels (Super-CHIP)
+def op_00fb(cpu, x, y, n, kk, nnn):
+    cpu.display.scroll_right(4)
+    cpu.draw = True
+    cpu.pc += 2
+
+# Opcode 00FC: Scroll the screen left 4 pixels (Super-CHIP)
+def op_00fc(cpu, x, y, n, kk, nnn):
+    cpu.display.scroll_left(4)
+    cpu.draw = True
+    cpu.pc += 2
+
+# Opcode 00FD: Exit the interpreter, the pc stays here (Super-CHIP)
+def op_00fd(cpu, x, y, n, kk, nnn):
+    pass
+
+# Opcode 00FE: Switch to the 64x32 screen (Super-CHIP)
+def op_00fe(cpu, x, y, n, kk, nnn):
+    cpu.display.set_resolution(*LOW_RESOLUTION)
+    cpu.draw = True
+    cpu.pc += 2
+
+# Opcode 00FF: Switch to the 128x64 screen (Super-CHIP)
+def op_00ff(cpu, x, y, n, kk, nnn):
+    cpu.display.set_resolution(*HIGH_RESOLUTION)
+    cpu.draw = True
+    cpu.pc += 2
+
+# Opcode 0NNN: Jump to a machine code routine at NNN, ignored by modern interpreters
+def op_0nnn(cpu, x, y, n, kk, nnn):
+    cpu.pc += 2
+
+# Opcode 1NNN: Jump to address NNN
+def op_1nnn(cpu, x, y, n, kk, nnn):
+    cpu.pc = nnn
+
+# Opcode 2NNN: Call subroutine at NNN
+def op_2nnn(cpu, x, y, n, kk, nnn):
+    cpu.stack[cpu.sp] = cpu.pc
+    cpu.sp += 1
+    cpu.pc = nnn
+
+# Opcode 3XKK: Skips next instruction if value stored in register X = KK
+def op_3xkk(cpu, x, y, n, kk, nnn):
+    if cpu.registers[x] == kk:
+        cpu.pc += 4
+    else:
+        cpu.pc += 2
+
+# Opcode 4XKK: Skips next instruction if value stored in register X != KK
+def op_4xkk(cpu, x, y, n, kk, nnn):
+    if cpu.registers[x] != kk:
+        cpu.pc += 4
+    else:
+        cpu.pc += 2
+
+# Opcode 5XY0: Skips next instruction if value stored in register X = value in register Y
+def op_5xy0(cpu, x, y, n, kk, nnn):
+    if cpu.registers[x] == cpu.registers[y]:
+        cpu.pc += 4
+    else:
+        cpu.pc += 2
+
+# Opcode 6XKK: Load KK into register X
+def op_6xkk(cpu, x, y, n, kk, nnn):
+    cpu.registers[x] = kk
+    cpu.pc += 2
+
+# Opcode 7XKK: Adds KK to the value in register X and stores it in register X
+def op_7xkk(cpu, x, y, n, kk, nnn):
+    cpu.registers[x] = (cpu.registers[x] + kk) & 0xFF
+    cpu.pc += 2
+
+# Opcode 8XY0: Set value of register X to the value of register Y
+def op_8xy0(cpu, x, y, n, kk, nnn):
+    cpu.registers[x] = cpu.registers[y]
+    cpu.pc += 2
+
+# Opcode 8XY1: Set value of register X to (value of register X OR value of register Y)
+def op_8xy1(cpu, x, y, n, kk, nnn):
+    cpu.registers[x] |= cpu.registers[y]
+    cpu.pc += 2
+
+# Opcode 8XY2: Set value of register X to (value of register X AND value of register Y)
+def op_8xy2(cpu, x, y, n, kk, nnn):
+    cpu.registers[x] &= cpu.registers[y]
+    cpu.pc += 2
+
+# Opcode 8XY3: Set value of register X to (value of register X XOR value of register Y)
+def op_8xy3(cpu, x, y, n, kk, nnn):
+    cpu.registers[x] ^= cpu.registers[y]
+    cpu.pc += 2
+
+# Opcode 8XY4: Set value of register X to (value of register X ADD value of register Y) and set carry
+def op_8xy4(cpu, x, y, n, kk, nnn):
+    registers = cpu.registers
+    value_sum = registers[x] + registers[y]
+    if value_sum > 0xFF:
+        registers[0xF] = 1
+        registers[x] = value_sum & 0x00FF
+    else:
+        registers[0xF] = 0
+        registers[x] = value_sum
+    cpu.pc += 2
+
+# Opcode 8XY5: Set value of register X to (value of register X SUB value of register Y)
+def op_8xy5(cpu, x, y, n, kk, nnn):
+    registers = cpu.registers
+    # Sets carry register to 0 if there is a borrow else set to 1
+    if registers[x] > registers[y]:
+        registers[0xF] = 1
+    else:
+        registers[0xF] = 0
+    registers[x] = (registers[x] - registers[y]) & 0xFF
+    cpu.pc += 2
+
+# Opcode 8XY6: Right shift the value of register X by 1
+def op_8xy6(cpu, x, y, n, kk, nnn):
+    registers = cpu.registers
+    registers[0xF] = registers[x] & 0x0001
+    registers[x] = registers[x] >> 1
+    cpu.pc += 2
+
+# Opcode 8XY7: Set value of register X to (value of register Y SUB value of register X)
+def op_8xy7(cpu, x, y, n, kk, nnn):
+    registers = cpu.registers
+    # Sets carry register to 0 if there is a borrow else set to 1
+    if registers[x] < registers[y]:
+        registers[0xF] = 1
+    else:
+        registers[0xF] = 0
+    registers[x] = (registers[y] - registers[x]) & 0xFF
+    cpu.pc += 2
+
+# Opcode 8XYE: Left shift the value of register X by 1
+def op_8xye(cpu, x, y, n, kk, nnn):
+    registers = cpu.registers
+    registers[0xF] = registers[x] >> 7
+    registers[x] = (registers[x] << 1) & 0xFF
+    cpu.pc += 2
+
+# Opcode 9XY0: Skip next instruction if value of register X != value of register Y
+def op_9xy0(cpu, x, y, n, kk, nnn):
+    if cpu.registers[x] != cpu.registers[y]:
+        cpu.pc += 4
+    else:
+        cpu.pc += 2
+
+# Opcode ANNN: Set value of register I to NNN
+def op_annn(cpu, x, y, n, kk, nnn):
+    cpu.register_I = nnn
+    cpu.pc += 2
+
+# Opcode BNNN: Jump to location NNN + value of register 0
+def op_bnnn(cpu, x, y, n, kk, nnn):
+    cpu.pc = nnn + cpu.registers[0]
+
+# Opcode CXKK: Sets the value of register X to (random byte AND KK)
+def op_cxkk(cpu, x, y, n, kk, nnn):
+    cpu.registers[x] = cpu.rng.randint(0, 255) & kk
+    cpu.pc += 2
+
+# Opcode DXYN: Display an N-byte sprite starting at memory location I at (value of register X, value of register Y)
+def op_dxyn(cpu, x, y, n, kk, nnn):
+    cpu.draw_sprite(cpu.registers[x], cpu.registers[y], n)
+    cpu.pc += 2
+
+# Opcode EX9E: Skips the next instruction if key with the value of register X is pressed
+def op_ex9e(cpu, x, y, n, kk, nnn):
+    if cpu.keys[x] != 0:
+        cpu.pc += 4
+    else:
+        cpu.pc += 2
+
+# Opcode EXA1: Skips the next instruction if key with the value of register X is not pressed
+def op_exa1(cpu, x, y, n, kk, nnn):
+    if cpu.keys[x] == 0:
+        cpu.pc += 4
+    else:
+        cpu.pc += 2
+
+# Opcode FX07: Set the value of register X to the value of the delay timer
+def op_fx07(cpu, x, y, n, kk, nnn):
+    cpu.registers[x] = cpu.delay_timer
+    cpu.pc += 2
+
+# Opcode FX0A: Wait for a key press and stores the value of the pressed key into register X
+# The CPU halts until press_key is called, which stores the key in register X
+def op_fx0a(cpu, x, y, n, kk, nnn):
+    cpu.waiting_key = x
+    cpu.pc += 2
+
+# Opcode FX15: Set the value of the delay timer to the value of register X
+def op_fx15(cpu, x, y, n, kk, nnn):
+    cpu.delay_timer = cpu.registers[x]
+    cpu.pc += 2
+
+# Opcode FX18: Set the value of the sound timer to the value of register X
+def op_fx18(cpu, x, y, n, kk, nnn):
+    cpu.sound_timer = cpu.registers[x]
+    cpu.pc += 2
+
+# Opcode FX1E: Set the value of register I to (value of register I + value of register X)
+def op_fx1e(cpu, x, y, n, kk, nnn):
+    cpu.register_I = (cpu.register_I + cpu.registers[x]) & 0xFFFF
+    cpu.pc += 2
+
+# Opcode FX29: Set value of register I to the location of sprite for the digit of the value of register X
+def op_fx29(cpu, x, y, n, kk, nnn):
+    cpu.register_I = cpu.registers[x] * 0x5
+    cpu.pc += 2
+
+# Opcode FX33: Store the binary-coded decimal representation of the value of register X in memory locations I, I+1, and I+2
+def op_fx33(cpu, x, y, n, kk, nnn):
+    value = cpu.registers[x]
+    cpu.write_memory(cpu.register_I, [(value // 100) % 10, (value // 10) % 10, value % 10])
+    cpu.pc += 2
+
+# Opcode FX55: Store the values of register 0 through X in memory starting in location of the value of register I
+def op_fx55(cpu, x, y, n, kk, nnn):
+    cpu.write_memory(cpu.register_I, cpu.registers[0:x + 1])
+    cpu.pc += 2
+
+# Opcode FX65: Load the registers 0 through X with values starting from the address of the value of register I
+def op_fx65(cpu, x, y, n, kk, nnn):
+    cpu.registers[0:x + 1] = cpu.read_memory(cpu.register_I, x + 1)
+    cpu.pc += 2
+
+# Any opcode that is not a Chip-8 or Super-CHIP instruction
+def op_invalid(cpu, x, y, n, kk, nnn):
+    raise ValueError("Invalid opcode 0x%04X at 0x%03X" % (cpu.get_opcode(), cpu.pc))
+
+# Opcodes that are identified by their first hex alone
+FIRST_HEX_HANDLERS = {
+    0x1: op_1nnn,
+    0x2: op_2nnn,
+    0x3: op_3xkk,
+    0x4: op_4xkk,
+    0x6: op_6xkk,
+    0x7: op_7xkk,
+    0xA: op_annn,
+    0xB: op_bnnn,
+    0xC: op_cxkk,
+    0xD: op_dxyn,
+}
+
+# Opcodes of the form 8XYN identified by their last hex
+ALU_HANDLERS = {
+    0x0: op_8xy0,
+    0x1: op_8xy1,
+    0x2: op_8xy2,
+    0x3: op_8xy3,
+    0x4: op_8xy4,
+    0x5: op_8xy5,
+    0x6: op_8xy6,
+    0x7: op_8xy7,
+    0xE: op_8xye,
+}
+
+# Super-CHIP opcodes of the form 00KK
+SYSTEM_HANDLERS = {
+    0x00FB: op_00fb,
+    0x00FC: op_00fc,
+    0x00FD: op_00fd,
+    0x00FE: op_00fe,
+    0x00FF: op_00ff,
+}
+
+# Opcodes of the form EXKK and FXKK identified by their last byte
+KEY_HANDLERS = {
+    0x9E: op_ex9e,
+    0xA1: op_exa1,
+}
+
+MISC_HANDLERS = {
+    0x07: op_fx07,
+    0x0A: op_fx0a,
+    0x15: op_fx15,
+    0x18: op_fx18,
+    0x1E: op_fx1e,
+    0x29: op_fx29,
+    0x33: op_fx33,
+    0x55: op_fx55,
+    0x65: op_fx65,
+}
+
+def decode(opcode):
+    """
+    Finds the handler for the given opcode and splits the opcode into its fields. Returns a
+    tuple of (handler, x, y, n, kk, nnn).
+    """
+    first_hex = (opcode & 0xF000) >> 12
+    x = (opcode & 0x0F00) >> 8
+    y = (opcode & 0x00F0) >> 4
+    n = opcode & 0x000F
+    kk = opcode & 0x00FF
+    nnn = opcode & 0x0FFF
+    handler = op_invalid
+    if first_hex in FIRST_HEX_HANDLERS:
+        handler = FIRST_HEX_HANDLERS[first_hex]
+    elif first_hex == 0x0:
+        if opcode == 0x00E0:
+            handler = op_00e0
+        elif opcode == 0x00EE:
+            handler = op_00ee
+        elif opcode in SYSTEM_HANDLERS:
+            handler = SYSTEM_HANDLERS[opcode]
+        elif opcode & 0xFFF0 == 0x00C0:
+            handler = op_00cn
+        elif opcode & 0xFFF0 == 0x00D0:
+            handler = op_00dn
+        else:
+            handler = op_0nnn
+    elif first_hex == 0x5 and n == 0x0:
+        handler = op_5xy0
+    elif first_hex == 0x8:
+        handler = ALU_HANDLERS.get(n, op_invalid)
+    elif first_hex == 0x9 and n == 0x0:
+        handler = op_9xy0
+    elif first_hex == 0xE:
+        handler = KEY_HANDLERS.get(kk, op_invalid)
+    elif first_hex == 0xF:
+        handler = MISC_HANDLERS.get(kk, op_invalid)
+    return (handler, x, y, n, kk, nnn)
+
+def opcode_name(opcode):
+    """
+    Returns the name of the class of instruction the opcode belongs to, for example 8XY4 for
+    0x8124 or DXYN for 0xD015.
+    """
+    handler = decode(opcode)[0]
+    return handler.__name__[3:].upper()
+
+# The decoded table is shared by every CPU and only built the first time it is needed
+opcode_table = None
+
+def get_opcode_table():
+    global opcode_table
+    if opcode_table is None:
+        opcode_table = [decode(opcode) for opcode in range(0x10000)]
+    return opcode_table
+
+class DispatchCPU(CPU):
+    """
+    A Chip-8 CPU that performs opcodes through the pre-decoded opcode table instead of the
+    if/elif chain of the original interpreter. Everything else about the CPU is unchanged so
+    the two can be run side by side and compared.
+    """
+    __slots__ = ('opcode_table',)
+
+    def __init__(self, display, seed = None):
+        CPU.__init__(self, display, seed)
+        self.opcode_table = get_opcode_table()
+
+    def perform_opcode(self, opcode):
+        handler, x, y, n, kk, nnn = self.opcode_table[opcode]
+        handler(self, x, y, n, kk, nnn)
@@ -1,26 +1,50 @@
 import sys
-import pygame
+import time
+from framebuffer import DisplayBackend
 
-class Display():
+# pygame is imported by load_pygame when the first window is created, so running headless
+# never loads it or starts SDL
+pygame = None
+
+def load_pygame():
+    """
+    Imports pygame if it has not been imported yet and returns the module.
+    """
+    global pygame
+    if pygame is None:
+        import pygame as module
+        pygame = module
+    return pygame
+
+class Display(DisplayBackend):
     """
     Emulates the display of a Chip-8 system. The orignal implementation is a monochrome display
     and has a width of 64 pixels and a height of 32 pixels. The upper left corner is considered 
     the (0,0) coordinate and the bottom left is considered the (63, 31) coordinate. Sprites are 
-    8x5 pixels on the display. 
+    8x5 pixels on the display. Super-CHIP roms can switch to 128x64, the window then keeps its
+    size and each pixel is drawn at half the scale.
     """
     def __init__(self, width = 64, height = 32, scale = 10):
         """ 
         Sets the proper dimensions for Chip-8 screen. Scale is the value width and height are 
         multiplied by since 64x32 pixels is small on modern systems.
         """
-        self.width = width
-        self.height = height
+        load_pygame()
+        DisplayBackend.__init__(self, width, height)
         self.scale = scale
+        # The window keeps its size when the resolution changes, the scale changes instead
+        self.window_width = width * scale
         self.display = None
         self.colors = [
             (0, 0, 0, 255),
             (250, 250, 250, 255)
         ]
+        # Time is divided into slots of frame_time seconds and the screen is shown at most once
+        # in each slot
+        self.frame_time = 1.0 / 60
+        self.present_slot = None
+        self.pending = False
+        self.dirty_rows = set()
 
     """
     Initializes the display based on the given scale. Adds a title to the display and colors the 
@@ -31,28 +55,103 @@ class Display():
         true_height = self.height * self.scale
         self.display = pygame.display.set_mode((true_width, true_height))
         pygame.display.set_caption("Chippy: Chip-8 Emulator")
-        self.clear_display()
-        self.update_display()
+        self.display.fill(self.colors[0])
+        pygame.display.flip()
 
     """
-    Updates the full display Surface of pygame to the screen
+    Asks for the screen to be shown. The screen is shown by the next call to refresh, which the
+    scheduler makes once every frame.
     """
     def update_display(self):
-        pygame.display.flip()
+        self.pending = True
+
+    def refresh(self):
+        """
+        Shows the screen if an update is pending and it has not been shown yet in the current
+        frame slot, so the window is presented at most 60 times a second. Slots are fixed, so a
+        refresh that comes a little early because of timer jitter is not pushed to the next
+        frame the way it would be by measuring from the last present.
+        """
+        if self.pending and int(time.monotonic() // self.frame_time) != self.present_slot:
+            self.present()
+
+    def present(self):
+        """
+        Repaints the rows that changed since the screen was last shown and uploads only those
+        rows to the window.
+        """
+        rects = []
+        row_width = self.width * self.scale
+        for y_coord in sorted(self.dirty_rows):
+            self.draw_row(y_coord)
+            # Rows next to each other are uploaded as one rectangle
+            if rects and rects[-1][1] + rects[-1][3] == y_coord * self.scale:
+                x, y, width, height = rects[-1]
+                rects[-1] = (x, y, width, height + self.scale)
+            else:
+                rects.append((0, y_coord * self.scale, row_width, self.scale))
+        if rects:
+            pygame.display.update(rects)
+        self.dirty_rows = set()
+        self.pending = False
+        self.present_slot = int(time.monotonic() // self.frame_time)
 
     def clear_display(self):
-        self.display.fill(self.colors[0])
+        DisplayBackend.clear_display(self)
+        self.dirty_rows.update(range(self.height))
 
-    def check_pixel(self, x_coord, y_coord):
-        x = x_coord * self.scale
-        y = y_coord * self.scale
-        if self.display.get_at((x, y)) == self.colors[0]:
-            return 0
-        else:
-            return 1
+    def load_screen(self, data):
+        DisplayBackend.load_screen(self, data)
+        self.dirty_rows.update(range(self.height))
+        self.pending = True
 
     def set_pixel(self, x_coord, y_coord, color):
-        x = x_coord * self.scale
+        DisplayBackend.set_pixel(self, x_coord, y_coord, color)
+        self.dirty_rows.add(y_coord)
+
+    def set_resolution(self, width, height):
+        DisplayBackend.set_resolution(self, width, height)
+        self.scale = max(1, self.window_width // width)
+        self.dirty_rows = set(range(self.height))
+
+    def scroll_down(self, lines):
+        DisplayBackend.scroll_down(self, lines)
+        self.dirty_rows.update(range(self.height))
+
+    def scroll_up(self, lines):
+        DisplayBackend.scroll_up(self, lines)
+        self.dirty_rows.update(range(self.height))
+
+    def scroll_right(self, pixels):
+        DisplayBackend.scroll_right(self, pixels)
+        self.dirty_rows.update(range(self.height))
+
+    def scroll_left(self, pixels):
+        DisplayBackend.scroll_left(self, pixels)
+        self.dirty_rows.update(range(self.height))
+
+    def draw_sprite(self, x_coord, y_coord, sprite, sprite_width = 8):
+        collision = DisplayBackend.draw_sprite(self, x_coord, y_coord, sprite, sprite_width)
+        for offset in range(0, len(sprite)):
+            if sprite[offset] != 0:
+                self.dirty_rows.add((y_coord + offset) % self.height)
+        return collision
+
+    def draw_row(self, y_coord):
+        """
+        Repaints a whole row of the screen from the framebuffer. The row is cleared first and
+        every run of pixels that are on is then drawn as a single rectangle.
+        """
+        row = self.framebuffer.rows[y_coord]
         y = y_coord * self.scale
-        print(str(x) + " " + str(y))
-        pygame.draw.rect(self.display, self.colors[color],(x, y, self.scale, self.scale)) 
+        self.display.fill(self.colors[0], (0, y, self.width * self.scale, self.scale))
+        x_coord = 0
+        while row:
+            # Skip to the next pixel that is on and measure how many follow it
+            leading = self.width - row.bit_length()
+            x_coord += leading
+            row = (row << leading) & self.framebuffer.full_row
+            length = self.width - ((~row) & self.framebuffer.full_row).bit_length()
+            self.display.fill(self.colors[1], (x_coord * self.scale, y, length * self.scale, self.scale))
+            x_coord += length
+            row = (row << length) & self.framebuffer.full_row
@@ -0,0 +1,10 @@
+from cpu import CPU
+from dispatch import DispatchCPU
+from translate import BlockCPU
+
+# The interpreters that can be selected to run a rom
+ENGINES = {
+    'interpreter': CPU,
+    'table': DispatchCPU,
+    'block': BlockCPU,
+}
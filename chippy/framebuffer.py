@@ -0,0 +1,163 @@
+import hashlib
+
+class FrameBuffer(object):
+    """
+    A monochrome screen stored as one integer per row with one bit per pixel. The left most
+    pixel of a row is the most significant bit, so the pixel at (x, y) is the bit
+    (width - 1 - x) of rows[y].
+    """
+    def __init__(self, width = 64, height = 32):
+        self.width = width
+        self.height = height
+        self.full_row = (1 << width) - 1
+        self.rows = [0] * height
+
+    def clear(self):
+        self.rows = [0] * self.height
+
+    def resize(self, width, height):
+        """
+        Changes the size of the screen, which is cleared.
+        """
+        self.width = width
+        self.height = height
+        self.full_row = (1 << width) - 1
+        self.rows = [0] * height
+
+    def scroll_down(self, lines):
+        lines = min(lines, self.height)
+        self.rows = [0] * lines + self.rows[:self.height - lines]
+
+    def scroll_up(self, lines):
+        lines = min(lines, self.height)
+        self.rows = self.rows[lines:] + [0] * lines
+
+    def scroll_right(self, pixels):
+        self.rows = [row >> pixels for row in self.rows]
+
+    def scroll_left(self, pixels):
+        full_row = self.full_row
+        self.rows = [(row << pixels) & full_row for row in self.rows]
+
+    def get_pixel(self, x_coord, y_coord):
+        return (self.rows[y_coord] >> (self.width - 1 - x_coord)) & 1
+
+    def set_pixel(self, x_coord, y_coord, color):
+        bit = 1 << (self.width - 1 - x_coord)
+        if color:
+            self.rows[y_coord] |= bit
+        else:
+            self.rows[y_coord] &= ~bit
+
+    def to_bytes(self):
+        """
+        Returns the screen as bytes, one row after the other with the left most pixel of a row
+        in the most significant bit of its first byte.
+        """
+        row_bytes = (self.width + 7) // 8
+        return b''.join(row.to_bytes(row_bytes, 'big') for row in self.rows)
+
+    def load_bytes(self, data):
+        """
+        Replaces the screen with one returned by to_bytes.
+        """
+        row_bytes = (self.width + 7) // 8
+        if len(data) != row_bytes * self.height:
+            raise ValueError("Screen data is %d bytes, expected %d"
+                             % (len(data), row_bytes * self.height))
+        self.rows = [int.from_bytes(data[offset:offset + row_bytes], 'big')
+                     for offset in range(0, len(data), row_bytes)]
+
+    def digest(self):
+        """
+        Returns a hex SHA-1 hash of the screen for comparing screens between runs.
+        """
+        return hashlib.sha1(self.to_bytes()).hexdigest()
+
+    def draw_sprite(self, x_coord, y_coord, sprite, sprite_width = 8):
+        """
+        XORs the sprite onto the screen with its upper left corner at (x_coord, y_coord). Each
+        item of the sprite is one row sprite_width pixels wide, 8 for a byte per row and 16 for
+        the 16x16 sprites of Super-CHIP. Rows are shifted into place as a whole, wrapping
+        around the right edge, and rows past the bottom wrap around to the top. Returns 1 if
+        any pixel that was on is turned off and 0 otherwise.
+        """
+        width = self.width
+        height = self.height
+        rows = self.rows
+        # Distance from the right edge of the row to the right edge of the sprite
+        shift = width - sprite_width - (x_coord % width)
+        collision = 0
+        for offset in range(0, len(sprite)):
+            sprite_row = sprite[offset]
+            if sprite_row == 0:
+                continue
+            if shift >= 0:
+                mask = sprite_row << shift
+            else:
+                mask = (sprite_row >> -shift) | ((sprite_row << (width + shift)) & self.full_row)
+            y = (y_coord + offset) % height
+            row = rows[y]
+            if row & mask:
+                collision = 1
+            rows[y] = row ^ mask
+        return collision
+
+class DisplayBackend(object):
+    """
+    The interface the CPU uses to draw to a screen. Every backend keeps the contents of the
+    screen in a FrameBuffer so pixels can be checked without reading back from the device, and
+    only has to override the methods that show the screen somewhere.
+    """
+    def __init__(self, width = 64, height = 32):
+        self.width = width
+        self.height = height
+        self.framebuffer = FrameBuffer(width, height)
+
+    def init_display(self):
+        pass
+
+    def update_display(self):
+        pass
+
+    def refresh(self):
+        pass
+
+    def clear_display(self):
+        self.framebuffer.clear()
+
+    def check_pixel(self, x_coord, y_coord):
+        return self.framebuffer.get_pixel(x_coord, y_coord)
+
+    def set_pixel(self, x_coord, y_coord, color):
+        self.framebuffer.set_pixel(x_coord, y_coord, color)
+
+    def draw_sprite(self, x_coord, y_coord, sprite, sprite_width = 8):
+        return self.framebuffer.draw_sprite(x_coord, y_coord, sprite, sprite_width)
+
+    def set_resolution(self, width, height):
+        """
+        Switches the screen to a new size, clearing it. Used by the Super-CHIP opcodes that
+        change between the 64x32 and 128x64 modes.
+        """
+        self.width = width
+        self.height = height
+        self.framebuffer.resize(width, height)
+
+    def scroll_down(self, lines):
+        self.framebuffer.scroll_down(lines)
+
+    def scroll_up(self, lines):
+        self.framebuffer.scroll_up(lines)
+
+    def scroll_right(self, pixels):
+        self.framebuffer.scroll_right(pixels)
+
+    def scroll_left(self, pixels):
+        self.framebuffer.scroll_left(pixels)
+
+    def load_screen(self, data):
+        """
+        Replaces the whole screen with one saved by FrameBuffer.to_bytes.
+        """
+        self.framebuffer.load_bytes(data)
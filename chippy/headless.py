@@ -0,0 +1,14 @@
+from framebuffer import DisplayBackend
+
+class HeadlessDisplay(DisplayBackend):
+    """
+    A display that only keeps the screen in memory. Used to run roms without a video device,
+    for example in batch jobs on servers. The number of times the screen would have been shown
+    is counted in frames.
+    """
+    def __init__(self, width = 64, height = 32):
+        DisplayBackend.__init__(self, width, height)
+        self.frames = 0
+
+    def update_display(self):
+        self.frames += 1
@@ -0,0 +1,77 @@
+import threading
+from collections import deque
+
+# Keys of a modern keyboard mapped to the hex keypad of the Chip-8:
+#   1 2 3 4        1 2 3 C
+#   q w e r   ->   4 5 6 D
+#   a s d f        7 8 9 E
+#   z x c v        A 0 B F
+KEY_MAP = {
+    '1': 0x1, '2': 0x2, '3': 0x3, '4': 0xC,
+    'q': 0x4, 'w': 0x5, 'e': 0x6, 'r': 0xD,
+    'a': 0x7, 's': 0x8, 'd': 0x9, 'f': 0xE,
+    'z': 0xA, 'x': 0x0, 'c': 0xB, 'v': 0xF,
+}
+
+class Keypad(object):
+    """
+    Feeds key presses and releases into a CPU. Events can come from any thread, for example a
+    pygame event loop or a headless driver injecting keys, and are queued until process is
+    called by the thread running the CPU. A CPU waiting for a key in FX0A can sleep in wait
+    until an event arrives instead of spinning. If a recorder such as replay.InputRecorder is
+    given, every event applied to the CPU is passed to its record method.
+    """
+    def __init__(self, cpu, key_map = KEY_MAP, recorder = None):
+        self.cpu = cpu
+        self.key_map = key_map
+        self.recorder = recorder
+        self.events = deque()
+        self.condition = threading.Condition()
+
+    def press(self, key):
+        self.push(key, True)
+
+    def release(self, key):
+        self.push(key, False)
+
+    def push(self, key, pressed):
+        with self.condition:
+            self.events.append((key, pressed))
+            self.condition.notify_all()
+
+    def press_name(self, name):
+        """
+        Presses the Chip-8 key mapped to the keyboard key with the given name, if there is one.
+        """
+        if name in self.key_map:
+            self.press(self.key_map[name])
+
+    def release_name(self, name):
+        if name in self.key_map:
+            self.release(self.key_map[name])
+
+    def process(self):
+        """
+        Applies every queued event to the CPU. Returns the number of events applied.
+        """
+        applied = 0
+        with self.condition:
+            while self.events:
+                key, pressed = self.events.popleft()
+                if pressed:
+                    self.cpu.press_key(key)
+                else:
+                    self.cpu.release_key(key)
+                if self.recorder is not None:
+                    self.recorder.record(key, pressed)
+                applied += 1
+        return applied
+
+    def wait(self, timeout = None):
+        """
+        Sleeps until an event arrives or the timeout passes, then applies the queued events.
+        """
+        with self.condition:
+            if not self.events:
+                self.condition.wait(timeout)
+        self.process()
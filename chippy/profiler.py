@@ -0,0 +1,171 @@
+"""
+Opt-in instrumentation for finding hot spots in roms and in the emulator. A CPU only pays for
+profiling once a Profiler is attached to it; until then the cost is one check per cycle.
+
+    profiler = Profiler()
+    profiler.attach(cpu)
+    ...
+    print(profiler.report())
+    profiler.dump_json('profile.json')
+    profiler.dump_collapsed('profile.folded')
+
+Engines that perform one opcode at a time are timed per opcode. The block engine is timed per
+block, so its time is reported against the address each block starts at while the opcode
+counts are still exact.
+"""
+import json
+import time
+from dispatch import opcode_name
+
+class Profiler(object):
+    """
+    Counts and times the instructions a CPU performs, both per class of opcode and per address
+    in memory, along with the sprites drawn and screens presented by its display.
+    """
+    def __init__(self):
+        self.opcode_counts = {}
+        self.opcode_times = {}
+        self.address_counts = {}
+        self.address_times = {}
+        # Time spent per (opcode, address) pair, the stacks of the collapsed output
+        self.stacks = {}
+        self.draws = 0
+        self.presents = 0
+        self.engine = None
+        self.cpu = None
+        self.names = {}
+
+    def attach(self, cpu):
+        """
+        Starts profiling the CPU and counting the draws and presents of its display.
+        """
+        self.cpu = cpu
+        self.engine = type(cpu).__name__
+        cpu.profiler = self
+        display = cpu.display
+        draw_sprite = display.draw_sprite
+        def counted_draw_sprite(x_coord, y_coord, sprite, sprite_width = 8):
+            self.draws += 1
+            return draw_sprite(x_coord, y_coord, sprite, sprite_width)
+        display.draw_sprite = counted_draw_sprite
+        # The pygame display only shows the screen in present, update_display just asks for it
+        present_name = 'present' if hasattr(display, 'present') else 'update_display'
+        present = getattr(display, present_name)
+        def counted_present():
+            self.presents += 1
+            return present()
+        setattr(display, present_name, counted_present)
+
+    def detach(self):
+        """
+        Stops profiling and puts the display back the way it was.
+        """
+        if self.cpu is None:
+            return
+        display = self.cpu.display
+        for name in ('draw_sprite', 'present', 'update_display'):
+            if name in vars(display):
+                delattr(display, name)
+        self.cpu.profiler = None
+        self.cpu = None
+
+    def name(self, opcode):
+        name = self.names.get(opcode)
+        if name is None:
+            name = self.names[opcode] = opcode_name(opcode)
+        return name
+
+    def record(self, name, address, count, elapsed):
+        self.opcode_counts[name] = self.opcode_counts.get(name, 0) + count
+        self.opcode_times[name] = self.opcode_times.get(name, 0) + elapsed
+        self.address_counts[address] = self.address_counts.get(address, 0) + count
+        self.address_times[address] = self.address_times.get(address, 0) + elapsed
+        stack = (name, address)
+        self.stacks[stack] = self.stacks.get(stack, 0) + elapsed
+
+    def profile_opcode(self, cpu, opcode):
+        """
+        Performs a single opcode on the CPU and records how long it took.
+        """
+        address = cpu.pc
+        start = time.perf_counter_ns()
+        cpu.perform_opcode(opcode)
+        self.record(self.name(opcode), address, 1, time.perf_counter_ns() - start)
+
+    def profile_block(self, cpu, block):
+        """
+        Runs a translated block on the CPU. Every opcode in the block is counted and the time
+        is recorded against the address the block starts at.
+        """
+        start = time.perf_counter_ns()
+        block.run(cpu)
+        elapsed = time.perf_counter_ns() - start
+        for opcode in block.opcodes:
+            name = self.name(opcode)
+            self.opcode_counts[name] = self.opcode_counts.get(name, 0) + 1
+        self.address_counts[block.start] = self.address_counts.get(block.start, 0) + block.length
+        self.address_times[block.start] = self.address_times.get(block.start, 0) + elapsed
+        stack = ('BLOCK', block.start)
+        self.stacks[stack] = self.stacks.get(stack, 0) + elapsed
+
+    def results(self):
+        """
+        Returns everything recorded as a dictionary that can be written out as JSON.
+        """
+        instructions = sum(self.opcode_counts.values())
+        seconds = sum(self.address_times.values()) / 1e9
+        opcodes = [{'opcode': name, 'count': self.opcode_counts[name],
+                    'nanoseconds': self.opcode_times.get(name, 0)}
+                   for name in self.opcode_counts]
+        opcodes.sort(key=lambda entry: (-entry['nanoseconds'], -entry['count']))
+        addresses = [{'address': '0x%03X' % address, 'count': self.address_counts[address],
+                      'nanoseconds': self.address_times[address]}
+                     for address in self.address_counts]
+        addresses.sort(key=lambda entry: (-entry['nanoseconds'], -entry['count']))
+        return {
+            'engine': self.engine,
+            'instructions': instructions,
+            'seconds': seconds,
+            'instructions_per_second': instructions / seconds if seconds else 0,
+            'draws': self.draws,
+            'presents': self.presents,
+            'opcodes': opcodes,
+            'addresses': addresses,
+        }
+
+    def report(self, limit = 15):
+        """
+        Returns a readable summary with the most expensive opcodes and addresses first.
+        """
+        results = self.results()
+        lines = [
+            "Engine: %s" % results['engine'],
+            "Instructions: %d in %.3f s (%.0f per second)" % (
+                results['instructions'], results['seconds'], results['instructions_per_second']),
+            "Draws: %d  Presents: %d" % (results['draws'], results['presents']),
+            "",
+            "%-8s %12s %12s %10s" % ("Opcode", "Count", "Time (ms)", "ns/op"),
+        ]
+        for entry in results['opcodes'][:limit]:
+            lines.append("%-8s %12d %12.3f %10.0f" % (
+                entry['opcode'], entry['count'], entry['nanoseconds'] / 1e6,
+                entry['nanoseconds'] / entry['count']))
+        lines.append("")
+        lines.append("%-8s %12s %12s" % ("Address", "Count", "Time (ms)"))
+        for entry in results['addresses'][:limit]:
+            lines.append("%-8s %12d %12.3f" % (
+                entry['address'], entry['count'], entry['nanoseconds'] / 1e6))
+        return "\n".join(lines)
+
+    def dump_json(self, path):
+        with open(path, 'w') as output:
+            json.dump(self.results(), output, indent=2)
+
+    def dump_collapsed(self, path):
+        """
+        Writes the time spent in the collapsed stack format read by flamegraph tools, one
+        line per engine;opcode;address with the time in nanoseconds.
+        """
+        with open(path, 'w') as output:
+            for (name, address), elapsed in sorted(self.stacks.items()):
+                output.write("%s;%s;0x%03X %d\n" % (self.engine, name, address, elapsed))
@@ -0,0 +1,186 @@
+"""
+Deterministic replay of recorded input. A rom is run in lockstep, frame by frame as fast as
+the host allows, with a seeded random number generator and the key presses from an input
+script, so the same rom, script and seed always give the same run on every engine. A trace
+of state hashes taken every frame can be saved as a golden trace and checked by later runs:
+
+    python replay.py ROM SCRIPT --frames 600 --record-trace golden.jsonl --engine interpreter
+    python replay.py ROM SCRIPT --frames 600 --check-trace golden.jsonl --engine block
+
+An input script is a text file with one key change per line, written as the frame number,
+the key as a hex digit and 1 for pressed or 0 for released. Lines starting with # are
+comments:
+
+    # frame key state
+    120 5 1
+    135 5 0
+
+Scripts are recorded from live play with chippy.py --record-input, which runs with seed 0
+unless --seed is given, so the recording replays with the same seed and clock.
+"""
+import sys
+import json
+import hashlib
+import argparse
+from engines import ENGINES
+from headless import HeadlessDisplay
+from scheduler import Scheduler
+
+class InputScript(object):
+    """
+    Key presses and releases ordered by the frame they happen on.
+    """
+    def __init__(self, events = None):
+        # Maps a frame number to a list of (key, pressed) changes made before that frame
+        self.events = {}
+        for frame, key, pressed in events or []:
+            self.add(frame, key, pressed)
+
+    def add(self, frame, key, pressed):
+        if not 0 <= key <= 0xF:
+            raise ValueError("Key must be from 0 to F, got %r" % key)
+        self.events.setdefault(frame, []).append((key, 1 if pressed else 0))
+
+    def events_for(self, frame):
+        return self.events.get(frame, ())
+
+    def __iter__(self):
+        for frame in sorted(self.events):
+            for key, pressed in self.events[frame]:
+                yield frame, key, pressed
+
+    def __len__(self):
+        return sum(len(changes) for changes in self.events.values())
+
+    @classmethod
+    def load(cls, path):
+        script = cls()
+        with open(path) as lines:
+            for number, line in enumerate(lines, 1):
+                line = line.split('#', 1)[0].strip()
+                if not line:
+                    continue
+                try:
+                    frame, key, pressed = line.split()
+                    script.add(int(frame), int(key, 16), int(pressed))
+                except ValueError:
+                    raise ValueError("%s:%d: expected 'frame key state', got %r"
+                                     % (path, number, line))
+        return script
+
+    def save(self, path, comment = None):
+        """
+        Writes the script to path. comment, if given, is written as a comment line first.
+        """
+        with open(path, 'w') as output:
+            if comment is not None:
+                output.write("# %s\n" % comment)
+            output.write("# frame key state\n")
+            for frame, key, pressed in self:
+                output.write("%d %X %d\n" % (frame, key, pressed))
+
+class InputRecorder(object):
+    """
+    Records the key changes of a live run as an InputScript. Pass it to a Keypad as recorder
+    and every change the keypad applies is added at the frame the scheduler is about to run,
+    which is the frame replay applies it before.
+    """
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.script = InputScript()
+
+    def record(self, key, pressed):
+        self.script.add(self.scheduler.frames, key, pressed)
+
+    def save(self, path, comment = None):
+        self.script.save(path, comment)
+
+def state_hash(cpu):
+    """
+    Returns a hex SHA-1 hash of the registers, timers, stack and screen of the CPU.
+    """
+    digest = hashlib.sha1()
+    digest.update(bytes(cpu.registers))
+    digest.update(b''.join(value.to_bytes(2, 'big') for value in cpu.stack))
+    digest.update(("%d %d %d %d %d" % (cpu.register_I, cpu.pc, cpu.sp, cpu.delay_timer,
+                                       cpu.sound_timer)).encode('ascii'))
+    digest.update(cpu.display.framebuffer.to_bytes())
+    return digest.hexdigest()
+
+def replay(cpu, script, frames, clock_speed = 600):
+    """
+    Runs the CPU for the given number of frames, applying the key changes of the script at
+    the start of each frame. Returns the trace of (frame, state hash) after every frame.
+    """
+    scheduler = Scheduler(cpu, clock_speed=clock_speed, realtime=False)
+    trace = []
+    for frame in range(0, frames):
+        for key, pressed in script.events_for(frame):
+            if pressed:
+                cpu.press_key(key)
+            else:
+                cpu.release_key(key)
+        scheduler.run_frame()
+        trace.append((frame, state_hash(cpu)))
+    return trace
+
+def save_trace(trace, path):
+    with open(path, 'w') as output:
+        for frame, digest in trace:
+            output.write(json.dumps({'frame': frame, 'hash': digest}) + "\n")
+
+def load_trace(path):
+    trace = []
+    with open(path) as lines:
+        for line in lines:
+            if line.strip():
+                entry = json.loads(line)
+                trace.append((entry['frame'], entry['hash']))
+    return trace
+
+def compare_traces(expected, actual):
+    """
+    Returns the first frame where the traces differ, or None if they match.
+    """
+    for (frame, expected_hash), (_, actual_hash) in zip(expected, actual):
+        if expected_hash != actual_hash:
+            return frame
+    if len(expected) != len(actual):
+        return min(len(expected), len(actual))
+    return None
+
+def replay_rom(path, script, frames, engine = 'block', seed = 0, clock_speed = 600):
+    cpu = ENGINES[engine](HeadlessDisplay(), seed)
+    cpu.load_rom_file(path)
+    return replay(cpu, script, frames, clock_speed)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a Chip-8 rom with recorded input")
+    parser.add_argument('rom', help="path of the rom to run")
+    parser.add_argument('script', nargs='?', default=None,
+                        help="input script to replay (default: no input)")
+    parser.add_argument('--frames', type=int, default=600,
+                        help="number of frames to run (default: 600)")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='block',
+                        help="how opcodes are performed (default: block)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="seed of the random number generator (default: 0)")
+    parser.add_argument('--clock', type=int, default=600,
+                        help="instructions per second of emulated time (default: 600)")
+    parser.add_argument('--record-trace', default=None, metavar='FILE',
+                        help="write the trace of state hashes to FILE")
+    parser.add_argument('--check-trace', default=None, metavar='FILE',
+                        help="compare the run against the golden trace in FILE")
+    args = parser.parse_args()
+
+    script = InputScript() if args.script is None else InputScript.load(args.script)
+    trace = replay_rom(args.rom, script, args.frames, args.engine, args.seed, args.clock)
+    if args.record_trace is not None:
+        save_trace(trace, args.record_trace)
+    print("%d frames, final state %s" % (len(trace), trace[-1][1] if trace else '-'))
+    if args.check_trace is not None:
+        mismatch = compare_traces(load_trace(args.check_trace), trace)
+        if mismatch is not None:
+            print("Trace differs from %s at frame %d" % (args.check_trace, mismatch))
+            sys.exit(1)
+        print("Trace matches %s" % args.check_trace)
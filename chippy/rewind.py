@@ -0,0 +1,87 @@
+import zlib
+from collections import deque
+
+def xor_bytes(first, second):
+    """
+    Returns the XOR of two byte strings of the same length.
+    """
+    value = int.from_bytes(first, 'little') ^ int.from_bytes(second, 'little')
+    return value.to_bytes(len(first), 'little')
+
+class RewindBuffer(object):
+    """
+    A ring buffer of snapshots of a CPU used to rewind it. Only the newest snapshot is kept
+    whole. Every older one is stored as the zlib compressed XOR of it and the snapshot after it,
+    which is almost all zeros between frames, so each step back costs very little memory. Once
+    capacity snapshots are held the oldest one is dropped.
+    """
+    def __init__(self, capacity = 600, interval = 1):
+        """
+        Capacity is the most snapshots held. Interval is the number of frames between
+        snapshots taken by tick.
+        """
+        self.capacity = capacity
+        self.interval = interval
+        self.latest = None
+        self.deltas = deque(maxlen=max(0, capacity - 1))
+        self.ticks = 0
+
+    def __len__(self):
+        if self.latest is None:
+            return 0
+        return len(self.deltas) + 1
+
+    def size(self):
+        """
+        Returns the number of bytes used to store the snapshots.
+        """
+        if self.latest is None:
+            return 0
+        return len(self.latest) + sum(len(delta) for is_delta, delta in self.deltas)
+
+    def clear(self):
+        self.latest = None
+        self.deltas.clear()
+        self.ticks = 0
+
+    def record(self, cpu):
+        """
+        Takes a snapshot of the CPU and adds it to the buffer.
+        """
+        snapshot = cpu.snapshot()
+        if self.latest is not None and self.deltas.maxlen:
+            if len(self.latest) == len(snapshot):
+                self.deltas.append((True, zlib.compress(xor_bytes(self.latest, snapshot))))
+            else:
+                # The screen changed size so the previous snapshot is stored whole
+                self.deltas.append((False, zlib.compress(self.latest)))
+        self.latest = snapshot
+
+    def tick(self, cpu):
+        """
+        Called once per frame, records a snapshot every interval frames.
+        """
+        if self.ticks % self.interval == 0:
+            self.record(cpu)
+        self.ticks += 1
+
+    def rewind(self, cpu, steps = 1):
+        """
+        Restores the CPU to the snapshot taken the given number of snapshots before the newest
+        one, or the oldest one held if there are fewer. The snapshots after it are discarded.
+        Returns the number of snapshots stepped back.
+        """
+        if self.latest is None:
+            return 0
+        stepped = 0
+        snapshot = self.latest
+        while stepped < steps and self.deltas:
+            is_delta, delta = self.deltas.pop()
+            if is_delta:
+                snapshot = xor_bytes(snapshot, zlib.decompress(delta))
+            else:
+                snapshot = zlib.decompress(delta)
+            stepped += 1
+        self.latest = snapshot
+        cpu.restore(snapshot)
+        return stepped
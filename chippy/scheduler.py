@@ -0,0 +1,99 @@
+import time
+
+class Scheduler(object):
+    """
+    Runs a CPU at a fixed clock speed. Time is split into frames of 1/60 of a second, which is
+    also the rate the delay and sound timers count down at. Every frame the CPU performs
+    clock_speed / 60 instructions, the timers are decremented once and the display is
+    refreshed. When the clock speed is not a multiple of 60 the remainder is carried from
+    frame to frame, so exactly clock_speed instructions are performed every second. Any time
+    left over in the frame is slept off instead of spinning.
+
+    A CPU waiting for a key in FX0A with both timers at 0 has nothing to do, so instead of
+    running empty frames the scheduler parks it and sleeps until an input event arrives.
+    """
+    def __init__(self, cpu, clock_speed = 600, frame_rate = 60, realtime = True, rewind = None,
+                 recorder = None):
+        """
+        Clock speed is the number of instructions performed per second. If realtime is False
+        frames are run back to back as fast as the host allows. If a RewindBuffer is given it
+        is ticked at the end of every frame, and a MovieRecorder is given the screen of every
+        frame.
+        """
+        self.cpu = cpu
+        self.rewind = rewind
+        self.recorder = recorder
+        self.frame_rate = frame_rate
+        self.frame_time = 1.0 / frame_rate
+        self.clock_speed = clock_speed
+        # Instructions owed to the CPU, in units of 1 / frame_rate of an instruction
+        self.cycle_credit = 0
+        self.realtime = realtime
+        self.frames = 0
+        self.cycles = 0
+        self.running = False
+
+    def run_frame(self):
+        """
+        Performs one frame worth of instructions, decrements the timers and refreshes the
+        display. Returns the number of instructions performed.
+        """
+        cpu = self.cpu
+        self.cycle_credit += self.clock_speed
+        cycles = self.cycle_credit // self.frame_rate
+        self.cycle_credit -= cycles * self.frame_rate
+        performed = cpu.run_cycles(cycles)
+        cpu.timer_decrement()
+        cpu.display.refresh()
+        self.cycles += performed
+        self.frames += 1
+        if self.rewind is not None:
+            self.rewind.tick(cpu)
+        if self.recorder is not None:
+            self.recorder.record(self.frames, cpu.display.framebuffer)
+        return performed
+
+    def is_parked(self):
+        """
+        Returns True if running another frame would change nothing until a key is pressed.
+        """
+        cpu = self.cpu
+        return cpu.waiting_key is not None and cpu.delay_timer == 0 and cpu.sound_timer == 0
+
+    def run(self, frames = None, poll_events = None, wait_events = None):
+        """
+        Runs frames until the given number of frames have run, stop is called or poll_events
+        returns False. poll_events is called once per frame to handle input. wait_events is
+        called while the CPU is parked and should block until input arrives, for example
+        Keypad.wait; returning False from it stops the scheduler too.
+        """
+        self.running = True
+        next_frame = time.monotonic()
+        stop_frame = None if frames is None else self.frames + frames
+        while self.running and (stop_frame is None or self.frames < stop_frame):
+            self.run_frame()
+            if poll_events is not None and poll_events() is False:
+                break
+            if wait_events is not None and self.is_parked():
+                # Nothing is drawn while parked, so a screen refresh held back to keep to one
+                # present per frame is shown now, before blocking on input
+                display = self.cpu.display
+                if getattr(display, 'pending', False):
+                    display.present()
+                while self.running and self.is_parked():
+                    if wait_events() is False:
+                        self.running = False
+                next_frame = time.monotonic()
+                continue
+            if self.realtime:
+                next_frame += self.frame_time
+                delay = next_frame - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -self.frame_time:
+                    # Too far behind to catch up, start counting again from now
+                    next_frame = time.monotonic()
+        self.running = False
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,254 @@
+"""
+Basic block translation for the Chip-8 CPU. A run of straight-line instructions starting at a
+given address is compiled once into a single Python function and cached by its start address,
+so loops in a rom are no longer decoded again every time they are executed.
+
+When a rom is loaded with analysis every block reachable from its start is translated before
+the first frame. If the analysis shows that the rom never writes to its own code, writes to
+memory are no longer checked against the translated blocks.
+
+A block ends at the first instruction that can change the flow of the program or that has to
+see the world exactly as the original interpreter would: jumps, calls, returns, skips, drawing,
+key opcodes and writes to memory. That last instruction is performed through the
+opcode table of the dispatch engine after the inlined instructions before it.
+"""
+from dispatch import DispatchCPU, op_0nnn
+
+# The most instructions translated into a single block
+MAX_BLOCK_LENGTH = 64
+
+# Source for the opcodes that can be inlined into a block. Every template matches the
+# corresponding handler in dispatch.py, V is the register list of the CPU.
+INLINE_TEMPLATES = {
+    # Opcode 6XKK: Load KK into register X
+    0x6: ["V[{x}] = {kk}"],
+    # Opcode 7XKK: Adds KK to the value in register X
+    0x7: ["V[{x}] = (V[{x}] + {kk}) & 0xFF"],
+    # Opcode ANNN: Set value of register I to NNN
+    0xA: ["cpu.register_I = {nnn}"],
+    # Opcode CXKK: Sets the value of register X to (random byte AND KK)
+    0xC: ["V[{x}] = cpu.rng.randint(0, 255) & {kk}"],
+}
+
+ALU_TEMPLATES = {
+    0x0: ["V[{x}] = V[{y}]"],
+    0x1: ["V[{x}] |= V[{y}]"],
+    0x2: ["V[{x}] &= V[{y}]"],
+    0x3: ["V[{x}] ^= V[{y}]"],
+    0x4: ["value_sum = V[{x}] + V[{y}]",
+          "V[15] = 1 if value_sum > 0xFF else 0",
+          "V[{x}] = value_sum & 0xFF if value_sum > 0xFF else value_sum"],
+    0x5: ["V[15] = 1 if V[{x}] > V[{y}] else 0",
+          "V[{x}] = (V[{x}] - V[{y}]) & 0xFF"],
+    0x6: ["V[15] = V[{x}] & 1",
+          "V[{x}] = V[{x}] >> 1"],
+    0x7: ["V[15] = 1 if V[{x}] < V[{y}] else 0",
+          "V[{x}] = (V[{y}] - V[{x}]) & 0xFF"],
+    0xE: ["V[15] = V[{x}] >> 7",
+          "V[{x}] = (V[{x}] << 1) & 0xFF"],
+}
+
+MISC_TEMPLATES = {
+    # Opcode FX07: Set the value of register X to the value of the delay timer
+    0x07: ["V[{x}] = cpu.delay_timer"],
+    # Opcode FX15: Set the value of the delay timer to the value of register X
+    0x15: ["cpu.delay_timer = V[{x}]"],
+    # Opcode FX18: Set the value of the sound timer to the value of register X
+    0x18: ["cpu.sound_timer = V[{x}]"],
+    # Opcode FX1E: Set the value of register I to (value of register I + value of register X)
+    0x1E: ["cpu.register_I = (cpu.register_I + V[{x}]) & 0xFFFF"],
+    # Opcode FX29: Set value of register I to the location of sprite for the digit of register X
+    0x29: ["cpu.register_I = V[{x}] * 5"],
+    # Opcode FX65: Load the registers 0 through X from memory starting at register I
+    0x65: ["V[0:{x} + 1] = cpu.read_memory(cpu.register_I, {x} + 1)"],
+}
+
+def inline_source(opcode):
+    """
+    Returns the lines of source that perform the given opcode inside a block, or None if the
+    opcode has to end the block.
+    """
+    first_hex = (opcode & 0xF000) >> 12
+    fields = {
+        'x': (opcode & 0x0F00) >> 8,
+        'y': (opcode & 0x00F0) >> 4,
+        'kk': opcode & 0x00FF,
+        'nnn': opcode & 0x0FFF,
+    }
+    if first_hex in INLINE_TEMPLATES:
+        template = INLINE_TEMPLATES[first_hex]
+    elif first_hex == 0x8:
+        template = ALU_TEMPLATES.get(opcode & 0x000F)
+    elif first_hex == 0xF:
+        template = MISC_TEMPLATES.get(opcode & 0x00FF)
+    else:
+        template = None
+    if template is None:
+        return None
+    return [line.format(**fields) for line in template]
+
+class Block(object):
+    """
+    A translated block of instructions. Calling run(cpu) performs every instruction of the
+    block and leaves the pc at the next instruction to perform.
+    """
+    __slots__ = ('start', 'end', 'length', 'opcodes', 'run', 'source')
+
+    def __init__(self, start, end, opcodes, run, source):
+        self.start = start
+        self.end = end
+        self.length = len(opcodes)
+        self.opcodes = opcodes
+        self.run = run
+        self.source = source
+
+def translate(memory, start, opcode_table):
+    """
+    Compiles the block starting at the given address of memory into a Block. Raises
+    IndexError if there is no instruction at the address, like fetching it would.
+    """
+    if start + 1 >= len(memory):
+        raise IndexError("no instruction at 0x%X, past the end of memory" % start)
+    lines = ["def block(cpu):", "    V = cpu.registers"]
+    namespace = {}
+    pc = start
+    opcodes = []
+    while len(opcodes) < MAX_BLOCK_LENGTH and pc + 1 < len(memory):
+        opcode = memory[pc] << 8 | memory[pc + 1]
+        source = inline_source(opcode)
+        opcodes.append(opcode)
+        if source is None:
+            handler, x, y, n, kk, nnn = opcode_table[opcode]
+            if handler is op_0nnn:
+                pc += 2
+                continue
+            # The last instruction is performed by its handler which moves the pc itself
+            namespace['handler'] = handler
+            lines.append("    cpu.pc = %d" % pc)
+            lines.append("    handler(cpu, %d, %d, %d, %d, %d)" % (x, y, n, kk, nnn))
+            pc += 2
+            break
+        lines.extend("    " + line for line in source)
+        pc += 2
+    else:
+        lines.append("    cpu.pc = %d" % pc)
+    source = "\n".join(lines) + "\n"
+    exec(compile(source, "<chippy block %s>" % hex(start), "exec"), namespace)
+    return Block(start, pc, tuple(opcodes), namespace['block'], source)
+
+class BlockCPU(DispatchCPU):
+    """
+    A Chip-8 CPU that translates the rom into blocks of Python code the first time they are
+    reached and then runs each block with a single call. Blocks are thrown away whenever an
+    opcode writes to the memory they were translated from.
+    """
+    __slots__ = ('blocks', 'block_owners', 'guard_writes')
+
+    def __init__(self, display, seed = None):
+        DispatchCPU.__init__(self, display, seed)
+        self.blocks = {}
+        # For every memory address, the start addresses of the blocks translated from it
+        self.block_owners = [None] * len(self.memory)
+        # False once analysis has shown the rom never writes to its own code
+        self.guard_writes = True
+
+    def load_rom_bytes(self, rom_bytes, analyze = False):
+        self.flush_blocks()
+        DispatchCPU.load_rom_bytes(self, rom_bytes, analyze)
+
+    def prepare(self, analysis):
+        """
+        Translates every block that can be reached from the start of the rom.
+        """
+        pending = [analysis.start]
+        while pending:
+            address = pending.pop()
+            if address in self.blocks or address + 1 >= len(self.memory):
+                continue
+            block = self.get_block(address)
+            last = block.end - 2
+            pending.extend(analysis.successors.get(last, (block.end,)))
+        self.guard_writes = not analysis.code_is_static()
+
+    def restore(self, snapshot):
+        DispatchCPU.restore(self, snapshot)
+        self.flush_blocks()
+
+    def flush_blocks(self):
+        """
+        Throws away every translated block.
+        """
+        self.blocks = {}
+        self.block_owners = [None] * len(self.memory)
+        self.guard_writes = True
+
+    def get_block(self, address):
+        """
+        Returns the translated block starting at address, translating it if needed.
+        """
+        block = self.blocks.get(address)
+        if block is None:
+            block = translate(self.memory, address, self.opcode_table)
+            self.blocks[address] = block
+            for owned in range(block.start, min(block.end, len(self.memory))):
+                if self.block_owners[owned] is None:
+                    self.block_owners[owned] = set()
+                self.block_owners[owned].add(address)
+        return block
+
+    def invalidate(self, start, end):
+        """
+        Throws away every block translated from memory between start and end.
+        """
+        for address in range(start, min(end, len(self.memory))):
+            owners = self.block_owners[address]
+            if owners:
+                for block_start in list(owners):
+                    block = self.blocks.pop(block_start, None)
+                    if block is not None:
+                        for owned in range(block.start, min(block.end, len(self.memory))):
+                            self.block_owners[owned].discard(block_start)
+
+    def write_memory(self, address, values):
+        DispatchCPU.write_memory(self, address, values)
+        if self.guard_writes:
+            self.invalidate(address, address + len(values))
+
+    def perform_cycle(self):
+        """
+        Performs the block at the pc and returns the number of instructions it contained.
+        """
+        if self.waiting_key is not None:
+            return 0
+        block = self.blocks.get(self.pc)
+        if block is None:
+            block = self.get_block(self.pc)
+        if self.test == True:
+            print(hex(self.pc))
+            self.testing()
+        if self.profiler is None:
+            block.run(self)
+        else:
+            self.profiler.profile_block(self, block)
+        if self.draw == True:
+            self.display.update_display()
+            self.draw = False
+        return block.length
+
+    def run_cycles(self, count):
+        """
+        Performs count instructions, or fewer if the CPU starts waiting for a key. Whole blocks
+        are run while they fit in the count and the instructions left over are performed one
+        at a time through the opcode table, so every engine is at the same instruction after
+        the same count.
+        """
+        performed = 0
+        while performed < count and self.waiting_key is None:
+            block = self.blocks.get(self.pc)
+            if block is None:
+                block = self.get_block(self.pc)
+            if block.length <= count - performed:
+                performed += self.perform_cycle()
+            else:
+                performed += DispatchCPU.perform_cycle(self)
+        return performed